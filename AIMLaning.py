@@ -1,108 +1,849 @@
 # Artificial intelligence & machine LANING (ha)
 
+import json
+import mmap as memmap
+import os
+import random
+import struct
+import time
+import zlib
+from array import array
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
 
 class BayesCat(object):
     """
     generates an object that classifies provided data based on a set of training data
     """
 
-    def __init__(self, category_data, train_data, benign_words='', delimiter=' '):
+    def __init__(self, category_data=None, train_data=None, benign_words='', delimiter=' ',
+                 max_ngram=None, hash_buckets=None, min_count=None, top_k=None):
         """
         input parameter:    cat_data
-        data type:          array
+        data type:          iterable
         description:        ordered list of the category field. This list of categories
                             corresponds to the train_data input.
+                            when train_data is None, an iterable of (category, text) pairs.
+                            when both are None, the model starts empty (see partial_fit).
 
         input parameter:    train_data
-        data type:          array
+        data type:          iterable
         description:        ordered list of the text that is being parsed and used to determine
                             what text is associated with the categories.
 
         input parameter:    benign_words
         data type:          array
         description:        Set of words that can be ignored.
+
+        input parameter:    max_ngram
+        data type:          integer
+        description:        longest run of sequential words kept as a feature.
+                            defaults to None, which keeps every run in the text.
+
+        input parameter:    hash_buckets
+        data type:          integer
+        description:        when set, words are hashed instead of kept in a vocabulary and
+                            every feature is folded into one of this many buckets, which caps
+                            the features per category. collisions cost some accuracy.
+
+        input parameter:    min_count
+        data type:          integer
+        description:        once the training data is read, features seen fewer times than
+                            this in a category are dropped (see prune).
+
+        input parameter:    top_k
+        data type:          integer
+        description:        most features kept per category. enforced while training, so
+                            streaming input never holds more than 2 * top_k per category.
         """
 
         self._cat_scores = {}
         self._cat_counts = {}
         self._total_entries = 0
         self._delimiter = delimiter
+        self._max_ngram = max_ngram
+        self._hash_buckets = hash_buckets
+        self._min_count = min_count
+        self._top_k = top_k
+        self._vocab = {}
+        self._index = {}
+        self._cat_rank = {}
+        self._matrix = None
         if benign_words == '':
             self._benign_words = set()
         else:
-            self._benign_words = benign_words
-        self.__makeBayes__(category_data, train_data)
+            self._benign_words = set(benign_words)
+        if category_data is not None:
+            self.__makeBayes__(category_data, train_data)
+            if min_count:
+                self.prune(min_count=min_count)
 
     def __makeBayes__(self, category_data, train_data):
         """
         generates the scoring and count dictionaries
         """
-        for index, cat in enumerate(category_data):
+        for cat, text in self.__pairs__(category_data, train_data):
             if cat not in self._cat_scores:
                 self._cat_scores[cat] = {}
                 self._cat_counts[cat] = 1
+                self._cat_rank.setdefault(cat, len(self._cat_rank))
             else:
                 self._cat_counts[cat] += 1
             self._total_entries += 1
-            parsed_strings = train_data[index].split(self._delimiter)
-            self.__cleanStrings__(parsed_strings)
-            self.__addToCat__(cat, parsed_strings)
+            tokens = self.__tokenize__(text, grow=True)
+            self.__addToCat__(cat, tokens)
+            if self._top_k and len(self._cat_scores[cat]) > 2 * self._top_k:
+                self.__evict__(cat, self._top_k)
+        if self._top_k:
+            self.prune(top_k=self._top_k)
+        self._matrix = None
+
+    @staticmethod
+    def __pairs__(category_data, train_data):
+        """
+        yields (category, text) pairs from either two parallel iterables or one
+        iterable of pairs, without loading either into memory
+        """
+        if train_data is None:
+            return iter(category_data)
+        return zip(category_data, train_data)
+
+    def partial_fit(self, category_data, train_data=None):
+        """
+        input parameter:    category_data
+        data type:          iterable
+        description:        categories of the new examples, or (category, text) pairs
+                            when train_data is None. generators are consumed lazily.
+
+        optional input:     train_data
+        data type:          iterable
+        description:        text of the new examples, in the same order as category_data.
+
+        adds the examples to the trained counts in place.
+        """
+
+        if self._cat_scores is None:
+            print('error, model loaded with mmap is read only')
+            return False
+        self.__makeBayes__(category_data, train_data)
+        return True
+
+    def forget(self, category_data, train_data=None):
+        """
+        input parameter:    category_data
+        data type:          iterable
+        description:        categories of previously trained examples, or (category, text)
+                            pairs when train_data is None.
+
+        optional input:     train_data
+        data type:          iterable
+        description:        text of the examples, exactly as they were trained.
+
+        subtracts the examples from the trained counts in place.
+        a category with no examples left is removed.
+        """
+
+        if self._cat_scores is None:
+            print('error, model loaded with mmap is read only')
+            return False
+        for cat, text in self.__pairs__(category_data, train_data):
+            if cat not in self._cat_counts:
+                print('error, category was never trained', cat)
+                continue
+            self._total_entries -= 1
+            self.__removeFromCat__(cat, self.__tokenize__(text))
+            self._cat_counts[cat] -= 1
+            if self._cat_counts[cat] == 0:
+                for feature in list(self._cat_scores[cat]):
+                    self.__dropFeature__(cat, feature)
+                del self._cat_scores[cat]
+                del self._cat_counts[cat]
+        self._matrix = None
+        return True
+
+    def prune(self, min_count=None, top_k=None):
+        """
+        optional input:     min_count
+        description:        drop features seen fewer than min_count times in a category.
+
+        optional input:     top_k
+        description:        keep only the top_k most frequent features of each category.
+
+        trades accuracy for memory; the dropped counts are gone for good.
+        """
+
+        if self._cat_scores is None:
+            print('error, model loaded with mmap is read only')
+            return False
+        for cat, scores in self._cat_scores.items():
+            if min_count:
+                for feature in [feature for feature, count in scores.items() if count < min_count]:
+                    self.__dropFeature__(cat, feature)
+            if top_k and len(scores) > top_k:
+                self.__evict__(cat, top_k)
+        self._matrix = None
+        return True
+
+    def __evict__(self, category, top_k):
+        """
+        drops all but the top_k most frequent features of the category. shorter features
+        win ties, and a prefix is never rarer than its extensions, so the kept features
+        still contain every prefix of every kept feature.
+        """
+
+        scores = self._cat_scores[category]
+        if self._hash_buckets:
+            ranked = sorted(scores, key=scores.get, reverse=True)
+        else:
+            ranked = sorted(scores, key=lambda feature: (-scores[feature], len(feature)))
+        for feature in ranked[top_k:]:
+            self.__dropFeature__(category, feature)
 
     def __cleanStrings__(self, strings):
         """
         remove any benign words from the list of strings
         """
-        for word in strings:
-            if word in self._benign_words:
-                strings.remove(word)
+        return [word for word in strings if word not in self._benign_words]
+
+    def __tokenize__(self, text, grow=False):
+        """
+        splits the text, removes benign words and interns each word to an integer id.
+        when grow is False, words never seen in training map to None.
+        with hash_buckets set, the id is a stable hash of the word and nothing is kept.
+        """
+        strings = self.__cleanStrings__(text.split(self._delimiter))
+        if self._hash_buckets:
+            return [zlib.crc32(word.encode('utf-8')) for word in strings]
+        if grow:
+            vocab = self._vocab
+            return [vocab.setdefault(word, len(vocab)) for word in strings]
+        return [self._vocab.get(word) for word in strings]
+
+    def __ngrams__(self, tokens, known=None):
+        """
+        yields (feature, weight) for every run of sequential token ids, up to max_ngram
+        long. the feature is the run as a tuple, or its bucket with hash_buckets set, and
+        the weight is 2 ** (words - 1).
+        runs are cut at the first unknown (None) token since no trained feature holds it.
+        when known is given, runs are also cut at the first feature missing from it:
+        every prefix of a trained feature is itself trained, so nothing longer can match.
+        buckets do not keep that property, so known is ignored when hashing.
+        """
+        buckets = self._hash_buckets
+        if buckets:
+            known = None
+        length = len(tokens)
+        for index1 in range(length):
+            if self._max_ngram is None:
+                stop = length
+            else:
+                stop = min(length, index1 + self._max_ngram)
+            for index2 in range(index1, stop):
+                if tokens[index2] is None:
+                    break
+                feature = tuple(tokens[index1:index2+1])
+                if buckets:
+                    # crc32 like the words, not hash(): a saved model has to bucket
+                    # features the same way under every python
+                    feature = zlib.crc32(struct.pack('<%dI' % len(feature), *feature)) % buckets
+                elif known is not None and feature not in known:
+                    break
+                yield feature, 1 << (index2 - index1)
 
-    def __addToCat__(self, category, strings):
+    def __addToCat__(self, category, tokens):
         """
-        adds all sequential combinations of the provided list of strings to the provided category
+        adds all sequential combinations of the provided list of tokens to the provided category
         in the cat_scores dictionary
         """
 
-        for index1 in range(len(strings)):
-            for index2 in range(index1, len(strings)):
-                this_addition = ''
-                for this_idx in range(index1, index2+1):
-                    this_addition += ' '
-                    this_addition += strings[this_idx]
-                this_addition = this_addition[1:]
-                if this_addition not in self._cat_scores[category]:
-                    self._cat_scores[category][this_addition] = 1
-                else:
-                    self._cat_scores[category][this_addition] += 1
+        scores = self._cat_scores[category]
+        index = self._index
+        for feature, weight in self.__ngrams__(tokens):
+            scores[feature] = scores.get(feature, 0) + 1
+            postings = index.get(feature)
+            if postings is None:
+                postings = index[feature] = {}
+            postings[category] = postings.get(category, 0) + weight
+
+    def __removeFromCat__(self, category, tokens):
+        """
+        reverses __addToCat__ for the provided list of tokens
+        """
+
+        scores = self._cat_scores[category]
+        index = self._index
+        for feature, weight in self.__ngrams__(tokens, scores):
+            if feature not in scores:
+                continue
+            if scores[feature] == 1:
+                self.__dropFeature__(category, feature)
+            else:
+                scores[feature] -= 1
+                index[feature][category] -= weight
+
+    def __dropFeature__(self, category, feature):
+        """
+        removes one feature from a category and from the index
+        """
+
+        del self._cat_scores[category][feature]
+        postings = self._index[feature]
+        del postings[category]
+        if not postings:
+            del self._index[feature]
 
     def guess(self, description):
         """
         uses the provided description and returns the category that best matches
         """
 
-        desc_arr = description.split(self._delimiter)
-        self.__cleanStrings__(desc_arr)
+        # the index maps each feature to {category: count * 2 ** (words - 1)}, so only
+        # categories sharing a feature with the description are ever touched
+        index = self._index
+        totals = {}
+        for feature, _ in self.__ngrams__(self.__tokenize__(description), index):
+            if feature not in index:
+                continue
+            for cat, weight in index[feature].items():
+                totals[cat] = totals.get(cat, 0) + weight
 
         top_score = 0
         top_cat = ''
 
-        for cat in self._cat_counts:
-            this_score = 0
-            for index1 in range(len(desc_arr)):
-                for index2 in range(index1, len(desc_arr)):
-                    this_str = ''
-                    for this_idx in range(index1, index2+1):
-                        this_str += ' '
-                        this_str += desc_arr[this_idx]
-                    this_str = this_str[1:]
-                    if this_str in self._cat_scores[cat]:
-                        score_add = self._cat_scores[cat][this_str] / self._cat_counts[cat]
-                        score_add = score_add * (2 ** (this_str.count(' ')))
-                        this_score += score_add
-            if this_score > top_score:
+        for cat, total in totals.items():
+            this_score = total / self._cat_counts[cat]
+            # ties go to the category seen first in training
+            if this_score > top_score or \
+               (this_score == top_score and self._cat_rank[cat] < self._cat_rank[top_cat]):
                 top_cat = cat
                 top_score = this_score
         return top_cat
 
+    def __buildMatrix__(self):
+        """
+        flattens the index into a sparse feature x category weight matrix in CSR form:
+        row offsets, then the category column and weight of every posting, row by row.
+        weights are count * 2 ** (words - 1); the category counts are kept as a
+        separate vector so batch scores divide exactly like guess does.
+        a memory mapped model uses the arrays in the file as they are, so processes
+        sharing the file share the matrix too; those weights are the raw counts and
+        scaled says to multiply in 2 ** (words - 1) while scoring.
+        """
+        categories = sorted(self._cat_counts, key=self._cat_rank.get)
+        counts = np.array([self._cat_counts[cat] for cat in categories], dtype=float)
+        if isinstance(self._index, _MappedIndex):
+            offsets, cols, weights, scaled = self._index.csr()
+            self._matrix = (categories, _MappedRows(self._index), offsets, cols, weights,
+                            counts, scaled)
+            return
+
+        col_of = {cat: col for col, cat in enumerate(categories)}
+        rows = {}
+        offsets = array('Q', [0])
+        cols = array('I')
+        weights = array('d')
+        for row, (feature, postings) in enumerate(self._index.items()):
+            rows[feature] = row
+            cols.extend(map(col_of.__getitem__, postings))
+            weights.extend(postings.values())
+            offsets.append(len(cols))
+        self._matrix = (categories, rows, np.frombuffer(offsets, dtype=np.uint64),
+                        np.frombuffer(cols, dtype=np.uint32), np.frombuffer(weights),
+                        counts, False)
+
+    def guess_many(self, descriptions, batch_size=1024):
+        """
+        input parameter:    descriptions
+        data type:          iterable
+        description:        descriptions to classify.
+
+        optional input:     batch_size
+        description:        number of descriptions scored per matrix product.
+
+        returns a list with the same category guess would return for each description.
+        falls back to calling guess one at a time when numpy is not installed.
+        """
+
+        if np is None:
+            return [self.guess(description) for description in descriptions]
+        if self._matrix is None:
+            self.__buildMatrix__()
+
+        results = []
+        batch = []
+        for description in descriptions:
+            batch.append(description)
+            if len(batch) == batch_size:
+                results.extend(self.__scoreBatch__(batch, *self._matrix))
+                batch = []
+        if batch:
+            results.extend(self.__scoreBatch__(batch, *self._matrix))
+        return results
+
+    def __scoreBatch__(self, batch, categories, rows, offsets, cols, weights, counts, scaled):
+        """
+        scores one batch as a sparse (document x feature) by (feature x category) product:
+        the postings of every matched feature are summed per (document, category) pair
+        """
+
+        matched = []
+        docs = []
+        shifts = []
+        for doc, description in enumerate(batch):
+            for feature, weight in self.__ngrams__(self.__tokenize__(description), rows):
+                row = rows.get(feature)
+                if row is not None:
+                    matched.append(row)
+                    docs.append(doc)
+                    shifts.append(weight)
+
+        results = [''] * len(batch)
+        if not matched or not categories:
+            return results
+        matched = np.array(matched, dtype=np.int64)
+        starts = offsets[matched].astype(np.int64)
+        lengths = offsets[matched + 1].astype(np.int64) - starts
+        # positions of every posting of every matched row, row after row
+        ends = np.cumsum(lengths)
+        postings = np.arange(ends[-1]) + np.repeat(starts - ends + lengths, lengths)
+        values = weights[postings].astype(float)
+        if scaled:
+            values *= np.repeat(np.array(shifts, dtype=float), lengths)
+        pairs = np.repeat(np.array(docs, dtype=np.int64), lengths) * len(categories) + \
+            cols[postings]
+        totals = np.bincount(pairs, weights=values, minlength=len(batch) * len(categories))
+        totals = totals.reshape(len(batch), len(categories)) / counts
+        best = totals.argmax(axis=1)
+        for doc, (col, total) in enumerate(zip(best, totals[np.arange(len(batch)), best])):
+            if total > 0:
+                results[doc] = categories[col]
+        return results
+
+    @classmethod
+    def fit_parallel(cls, category_data, train_data=None, workers=None, chunk_size=10000,
+                     benign_words='', delimiter=' ', max_ngram=None, hash_buckets=None,
+                     min_count=None, top_k=None):
+        """
+        input parameter:    category_data, train_data
+        description:        training data in any form the constructor accepts.
+
+        optional input:     workers
+        description:        number of worker processes. defaults to the cpu count.
+
+        optional input:     chunk_size
+        description:        examples per shard handed to a worker.
+
+        trains shards of the corpus in a process pool and merges their counts in corpus
+        order, so the result is identical to a serial build (including token ids and
+        category tie order). at most two shards per worker are in flight at once.
+        top_k is enforced inside each shard and again as shards are merged, holding at
+        most 2 * top_k features per category like streaming input, then once more at
+        the end. min_count is applied once the shards are merged. either way pruned
+        models can differ from a serial build, since features are evicted on partial
+        counts.
+        """
+
+        settings = {'benign_words': benign_words, 'delimiter': delimiter,
+                    'max_ngram': max_ngram, 'hash_buckets': hash_buckets, 'top_k': top_k}
+        model = cls(**settings)
+        pairs = cls.__pairs__(category_data, train_data)
+        workers = workers or os.cpu_count() or 1
+
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            pending = []
+            while True:
+                while len(pending) < 2 * workers:
+                    shard = list(islice(pairs, chunk_size))
+                    if not shard:
+                        break
+                    pending.append(pool.submit(_train_shard, shard, settings))
+                if not pending:
+                    break
+                model.__merge__(pending.pop(0).result())
+        model.prune(min_count=min_count, top_k=top_k)
+        return model
+
+    def __merge__(self, shard):
+        """
+        adds the counts of a model trained on another shard into this model.
+        shard is the tuple returned by _train_shard.
+        """
+
+        vocab, categories, cat_counts, cat_scores, shard_index, total_entries = shard
+        remap = [self._vocab.setdefault(word, len(self._vocab)) for word in vocab]
+        # the first shard merged into an empty model keeps its ids, and hashed
+        # features have no vocabulary to remap
+        identity = all(token == local for local, token in enumerate(remap))
+        for cat in categories:
+            if cat not in self._cat_counts:
+                self._cat_scores[cat] = {}
+                self._cat_counts[cat] = 0
+                self._cat_rank.setdefault(cat, len(self._cat_rank))
+            self._cat_counts[cat] += cat_counts[cat]
+            scores = self._cat_scores[cat]
+            for feature, count in cat_scores[cat].items():
+                if not identity:
+                    feature = tuple([remap[token] for token in feature])
+                scores[feature] = scores.get(feature, 0) + count
+        index = self._index
+        for feature, shard_postings in shard_index.items():
+            if not identity:
+                feature = tuple([remap[token] for token in feature])
+            postings = index.get(feature)
+            if postings is None:
+                postings = index[feature] = {}
+            for cat, weight in shard_postings.items():
+                postings[cat] = postings.get(cat, 0) + weight
+        self._total_entries += total_entries
+        if self._top_k:
+            for cat in categories:
+                if len(self._cat_scores[cat]) > 2 * self._top_k:
+                    self.__evict__(cat, self._top_k)
+        self._matrix = None
+
+    def save(self, path):
+        """
+        input parameter:    path
+        description:        file the model is written to.
+
+        writes the model in a compact binary layout that load can memory map:
+            magic, version, header length, json header (settings, vocabulary,
+            categories, category counts), then 8 byte aligned arrays
+            feature offsets (u64), feature tokens (u32), posting offsets (u64),
+            posting categories (u32) and posting counts (u64).
+        with hash_buckets set, each feature is its single bucket and a posting weights
+        array (f64) follows, since bucket weights cannot be rebuilt from the counts.
+        features are sorted so a mapped model can binary search them.
+        """
+
+        if self._cat_scores is None:
+            print('error, model loaded with mmap is read only')
+            return False
+
+        categories = sorted(self._cat_counts, key=self._cat_rank.get)
+        cols = {cat: col for col, cat in enumerate(categories)}
+        vocab = sorted(self._vocab, key=self._vocab.get)
+        header = {
+            'delimiter': self._delimiter,
+            'max_ngram': self._max_ngram,
+            'hash_buckets': self._hash_buckets,
+            'min_count': self._min_count,
+            'top_k': self._top_k,
+            'benign_words': sorted(self._benign_words),
+            'vocab': vocab,
+            'categories': categories,
+            'cat_counts': [self._cat_counts[cat] for cat in categories],
+            'total_entries': self._total_entries,
+            'features': len(self._index),
+        }
+
+        feat_offsets = array('Q', [0])
+        feat_tokens = array('I')
+        post_offsets = array('Q', [0])
+        post_cats = array('I')
+        post_counts = array('Q')
+        post_weights = array('d')
+        for feature in sorted(self._index):
+            if self._hash_buckets:
+                feat_tokens.append(feature)
+            else:
+                feat_tokens.extend(feature)
+            feat_offsets.append(len(feat_tokens))
+            postings = self._index[feature]
+            for cat in sorted(postings, key=cols.get):
+                post_cats.append(cols[cat])
+                post_counts.append(self._cat_scores[cat][feature])
+                post_weights.append(postings[cat])
+            post_offsets.append(len(post_cats))
+
+        sections = [feat_offsets, feat_tokens, post_offsets, post_cats, post_counts]
+        if self._hash_buckets:
+            sections.append(post_weights)
+        with open(path, 'wb') as file:
+            head = json.dumps(header).encode('utf-8')
+            file.write(_MAGIC + struct.pack('<II', _FORMAT_VERSION, len(head)) + head)
+            for section in sections:
+                file.write(b'\0' * (-file.tell() % 8))
+                file.write(section.tobytes())
+        return True
+
+    @classmethod
+    def load(cls, path, mmap=True):
+        """
+        input parameter:    path
+        description:        file written by save.
+
+        optional input:     mmap
+        description:        when True the file is mapped read only and features are looked
+                            up in place, so many processes share one copy of the model.
+                            the model can guess but not be trained further.
+                            when False the model is read into regular dictionaries.
+        """
+
+        with open(path, 'rb') as file:
+            if mmap:
+                buffer = memmap.mmap(file.fileno(), 0, access=memmap.ACCESS_READ)
+            else:
+                buffer = file.read()
+        index = _MappedIndex(buffer)
+        header = index.header
+
+        model = cls(benign_words=header['benign_words'], delimiter=header['delimiter'],
+                    max_ngram=header['max_ngram'], hash_buckets=header['hash_buckets'],
+                    min_count=header['min_count'], top_k=header['top_k'])
+        model._vocab = {word: token for token, word in enumerate(header['vocab'])}
+        model._total_entries = header['total_entries']
+        for rank, cat in enumerate(header['categories']):
+            model._cat_counts[cat] = header['cat_counts'][rank]
+            model._cat_rank[cat] = rank
+
+        if mmap:
+            model._cat_scores = None
+            model._index = index
+        else:
+            for cat in model._cat_counts:
+                model._cat_scores[cat] = {}
+            for feature, postings in index.items():
+                model._index[feature] = postings
+            for feature, counts in index.items(counts=True):
+                for cat, count in counts.items():
+                    model._cat_scores[cat][feature] = count
+        return model
+
+
+def cross_validate(category_data, train_data=None, folds=10, seed=None, **settings):
+    """
+    input parameter:    category_data, train_data
+    description:        labelled examples in any form the BayesCat constructor accepts.
+
+    optional input:     folds
+    description:        number of folds. every example is held out exactly once.
+
+    optional input:     seed
+    description:        when given, examples are shuffled into folds with this seed.
+                        otherwise example i goes to fold i % folds.
+
+    optional input:     settings
+    description:        BayesCat keyword arguments (benign_words, delimiter, max_ngram, ...).
+
+    trains a single model on every example, then scores each fold by subtracting its
+    counts (forget), guessing its examples and adding them back (partial_fit), which
+    gives the same guesses as a model trained without the fold.
+    returns a dictionary with
+        accuracy:       share of all examples guessed correctly
+        fold_accuracy:  accuracy of each fold
+        confusion:      {actual category: {guessed category: count}}
+        train_seconds:  time of the single training pass
+        fold_seconds:   time to subtract, score and restore each fold
+    """
+
+    if settings.get('min_count') or settings.get('top_k'):
+        print('error, pruned counts cannot be subtracted, drop min_count / top_k')
+        return False
+
+    pairs = list(BayesCat.__pairs__(category_data, train_data))
+    order = list(range(len(pairs)))
+    if seed is not None:
+        random.Random(seed).shuffle(order)
+
+    start = time.perf_counter()
+    model = BayesCat(pairs, **settings)
+    results = {
+        'accuracy': 0.0,
+        'fold_accuracy': [],
+        'confusion': {},
+        'train_seconds': time.perf_counter() - start,
+        'fold_seconds': [],
+    }
+
+    correct = 0
+    for fold in range(folds):
+        start = time.perf_counter()
+        held_out = [pairs[idx] for idx in order[fold::folds]]
+        model.forget(held_out)
+        fold_correct = 0
+        for cat, text in held_out:
+            guessed = model.guess(text)
+            row = results['confusion'].setdefault(cat, {})
+            row[guessed] = row.get(guessed, 0) + 1
+            if guessed == cat:
+                fold_correct += 1
+        model.partial_fit(held_out)
+        results['fold_seconds'].append(time.perf_counter() - start)
+        results['fold_accuracy'].append(fold_correct / len(held_out) if held_out else 0.0)
+        correct += fold_correct
+
+    results['accuracy'] = correct / len(pairs) if pairs else 0.0
+    return results
+
+
+def _train_shard(shard, settings):
+    """
+    trains one shard of (category, text) pairs in a worker process and returns the
+    parts of the model BayesCat.__merge__ needs, with the vocabulary in id order
+    """
+
+    model = BayesCat(shard, **settings)
+    vocab = sorted(model._vocab, key=model._vocab.get)
+    categories = sorted(model._cat_counts, key=model._cat_rank.get)
+    return (vocab, categories, model._cat_counts, model._cat_scores, model._index,
+            model._total_entries)
+
+
+_MAGIC = b'BAYESCAT'
+_FORMAT_VERSION = 1
+
+
+class _MappedIndex(object):
+    """
+    read only view of the feature index in a file written by BayesCat.save.
+    behaves like the {feature: {category: weight}} dictionary BayesCat keeps in memory.
+    """
+
+    def __init__(self, buffer):
+        if bytes(buffer[:8]) != _MAGIC:
+            raise ValueError('not a BayesCat model file')
+        version, head_len = struct.unpack('<II', buffer[8:16])
+        if version != _FORMAT_VERSION:
+            raise ValueError('unsupported BayesCat model version %d' % version)
+        self.header = json.loads(bytes(buffer[16:16 + head_len]).decode('utf-8'))
+        self._buffer = buffer
+        self._categories = self.header['categories']
+        self._size = self.header['features']
+
+        self._position = 16 + head_len
+        self._view = memoryview(buffer)
+        self._feat_offsets = self.__section__('Q', self._size + 1)
+        self._feat_tokens = self.__section__('I', self._feat_offsets[-1])
+        self._post_offsets = self.__section__('Q', self._size + 1)
+        self._post_cats = self.__section__('I', self._post_offsets[-1])
+        self._post_counts = self.__section__('Q', self._post_offsets[-1])
+        self._hashed = bool(self.header['hash_buckets'])
+        if self._hashed:
+            self._post_weights = self.__section__('d', self._post_offsets[-1])
+        self._last = (None, None)
+
+    def __section__(self, code, length):
+        """
+        returns the next 8 byte aligned array of the file as a typed memoryview
+        """
+        self._position += -self._position % 8
+        width = struct.calcsize(code)
+        section = self._view[self._position:self._position + length * width].cast(code)
+        self._position += length * width
+        return section
+
+    def __len__(self):
+        return self._size
+
+    def __feature__(self, position):
+        start = self._feat_offsets[position]
+        if self._hashed:
+            return self._feat_tokens[start]
+        return tuple(self._feat_tokens[start:self._feat_offsets[position+1]])
+
+    def __postings__(self, position, feature, counts=False):
+        start = self._post_offsets[position]
+        stop = self._post_offsets[position+1]
+        categories = self._categories
+        if counts:
+            return {categories[self._post_cats[idx]]: self._post_counts[idx]
+                    for idx in range(start, stop)}
+        if self._hashed:
+            return {categories[self._post_cats[idx]]: int(self._post_weights[idx])
+                    for idx in range(start, stop)}
+        shift = len(feature) - 1
+        return {categories[self._post_cats[idx]]: self._post_counts[idx] << shift
+                for idx in range(start, stop)}
+
+    def position(self, feature):
+        """
+        row of the feature in the file, or None
+        """
+        low = 0
+        high = self._size
+        while low < high:
+            middle = (low + high) // 2
+            if self.__feature__(middle) < feature:
+                low = middle + 1
+            else:
+                high = middle
+        if low == self._size or self.__feature__(low) != feature:
+            return None
+        return low
+
+    def csr(self):
+        """
+        returns (row offsets, category columns, weights, scaled) as numpy arrays over the
+        file. unhashed weights are the raw counts, so scaled is True: each one still
+        needs multiplying by 2 ** (words - 1) of its feature
+        """
+        offsets = np.frombuffer(self._post_offsets, dtype=np.uint64)
+        cols = np.frombuffer(self._post_cats, dtype=np.uint32)
+        if self._hashed:
+            return offsets, cols, np.frombuffer(self._post_weights), False
+        return offsets, cols, np.frombuffer(self._post_counts, dtype=np.uint64), True
+
+    def get(self, feature, default=None):
+        # guess checks membership and then reads the postings, so keep the last hit.
+        # one tuple read, so threads sharing the model never see half an update
+        last = self._last
+        if last[0] == feature:
+            return last[1]
+        low = self.position(feature)
+        if low is None:
+            return default
+        postings = self.__postings__(low, feature)
+        self._last = (feature, postings)
+        return postings
+
+    def __contains__(self, feature):
+        return self.get(feature) is not None
+
+    def __getitem__(self, feature):
+        postings = self.get(feature)
+        if postings is None:
+            raise KeyError(feature)
+        return postings
+
+    def items(self, counts=False):
+        """
+        yields (feature, {category: weight}), or {category: count} when counts is True
+        """
+        for position in range(self._size):
+            feature = self.__feature__(position)
+            yield feature, self.__postings__(position, feature, counts)
+
+
+class _MappedRows(object):
+    """
+    feature -> row lookups over a _MappedIndex, the shape guess_many expects of its
+    row dictionary
+    """
+
+    def __init__(self, index):
+        self._index = index
+        self._last = (None, None)
+
+    def get(self, feature, default=None):
+        # last hit cached like _MappedIndex.get, for __ngrams__' membership check
+        last = self._last
+        if last[0] == feature:
+            row = last[1]
+        else:
+            row = self._index.position(feature)
+            self._last = (feature, row)
+        return default if row is None else row
+
+    def __contains__(self, feature):
+        return self.get(feature) is not None
+
 
 if __name__ == "__main__":
 
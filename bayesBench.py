@@ -0,0 +1,231 @@
+# benchmarks for the BayesCat classifier in AIMLaning
+
+import argparse
+import json
+import os
+import random
+import tempfile
+import time
+import tracemalloc
+
+from AIMLaning import BayesCat
+from benchTools import percentiles, write_report
+
+
+def make_corpus(docs, vocab_size=5000, categories=50, min_words=5, max_words=30, seed=0):
+    """
+    input parameter:    docs
+    data type:          integer
+    description:        number of (category, text) examples to generate.
+
+    optional input:     vocab_size, categories
+    description:        number of distinct words and categories in the corpus.
+
+    optional input:     min_words, max_words
+    description:        bounds on the number of words per example.
+
+    optional input:     seed
+    description:        seed for the generator; the same arguments always give the same corpus.
+
+    returns parallel lists of categories and texts. each category favours its own slice
+    of the vocabulary so the corpus is learnable, and word frequencies are skewed like
+    real text.
+    """
+
+    rng = random.Random(seed)
+    words = ['w%d' % number for number in range(vocab_size)]
+    weights = [1.0 / (rank + 1) for rank in range(vocab_size)]
+    topic_size = max(1, vocab_size // categories)
+    cat_names = ['cat%d' % number for number in range(categories)]
+
+    category_data = []
+    train_data = []
+    for _ in range(docs):
+        cat = rng.randrange(categories)
+        topic = words[cat * topic_size:(cat + 1) * topic_size] or words
+        length = rng.randint(min_words, max_words)
+        common = rng.choices(words, weights, k=length)
+        text = [rng.choice(topic) if rng.random() < 0.4 else word for word in common]
+        category_data.append(cat_names[cat])
+        train_data.append(' '.join(text))
+    return category_data, train_data
+
+
+def bench_parallel(docs=200000, workers=(1, 2, 4, 8), max_ngram=3, chunk_size=10000, seed=0):
+    """
+    times a serial build against fit_parallel at each worker count and returns a list
+    of {'workers', 'seconds', 'docs_per_sec', 'speedup'} rows. workers=0 is the serial build.
+    """
+
+    category_data, train_data = make_corpus(docs, seed=seed)
+
+    start = time.perf_counter()
+    BayesCat(category_data, train_data, max_ngram=max_ngram)
+    serial = time.perf_counter() - start
+    results = [{'workers': 0, 'seconds': serial, 'docs_per_sec': docs / serial, 'speedup': 1.0}]
+
+    for count in workers:
+        start = time.perf_counter()
+        BayesCat.fit_parallel(category_data, train_data, workers=count, chunk_size=chunk_size,
+                              max_ngram=max_ngram)
+        elapsed = time.perf_counter() - start
+        results.append({'workers': count, 'seconds': elapsed,
+                        'docs_per_sec': docs / elapsed, 'speedup': serial / elapsed})
+    return results
+
+
+def bench_memory(docs=50000, configs=None, holdout=0.2, seed=0):
+    """
+    trains one model per config (a dict of BayesCat keyword arguments) and returns a list
+    of {'config', 'features', 'index_size', 'model_mb', 'peak_mb', 'accuracy'} rows, where
+    accuracy is measured on a held out slice of the corpus. use it to pick a
+    hash_buckets / min_count / top_k setting that fits a memory ceiling.
+    """
+
+    if configs is None:
+        configs = [
+            {'max_ngram': 3},
+            {'max_ngram': 3, 'min_count': 2},
+            {'max_ngram': 3, 'top_k': 2000},
+            {'max_ngram': 3, 'hash_buckets': 1 << 14},
+            {'max_ngram': 3, 'hash_buckets': 1 << 12},
+        ]
+    category_data, train_data = make_corpus(docs, seed=seed)
+    split = int(docs * (1 - holdout))
+
+    results = []
+    for config in configs:
+        tracemalloc.start()
+        model = BayesCat(category_data[:split], train_data[:split], **config)
+        current, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        guesses = model.guess_many(train_data[split:])
+        correct = sum(guess == cat for guess, cat in zip(guesses, category_data[split:]))
+        results.append({
+            'config': config,
+            'features': sum(len(scores) for scores in model._cat_scores.values()),
+            'index_size': len(model._index),
+            'model_mb': current / 2 ** 20,
+            'peak_mb': peak / 2 ** 20,
+            'accuracy': correct / max(1, docs - split),
+        })
+    return results
+
+
+def run_suite(docs=50000, vocab_size=5000, categories=50, max_ngram=3, guesses=2000,
+              seed=0, **settings):
+    """
+    input parameter:    docs, vocab_size, categories, seed
+    description:        shape of the synthetic corpus (see make_corpus).
+
+    optional input:     max_ngram, settings
+    description:        BayesCat keyword arguments under test.
+
+    optional input:     guesses
+    description:        number of held out descriptions used for the latency numbers.
+
+    runs every BayesCat measurement on one seeded corpus and returns a dictionary:
+        training:       seconds, docs_per_sec, model_mb and peak_mb (traced separately)
+        features:       distinct features, (feature, category) counts and vocabulary size
+        guess:          per call latency percentiles and calls per second
+        guess_many:     seconds to build the weight matrix, then descriptions per second
+        model_file:     save size and seconds for save / mmap load / full load
+    """
+
+    category_data, train_data = make_corpus(docs + guesses, vocab_size, categories, seed=seed)
+    queries = train_data[docs:]
+    category_data = category_data[:docs]
+    train_data = train_data[:docs]
+    settings['max_ngram'] = max_ngram
+
+    start = time.perf_counter()
+    model = BayesCat(category_data, train_data, **settings)
+    train_seconds = time.perf_counter() - start
+
+    tracemalloc.start()
+    traced = BayesCat(category_data, train_data, **settings)
+    model_bytes, peak_bytes = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del traced
+
+    latencies = []
+    for query in queries:
+        start = time.perf_counter()
+        model.guess(query)
+        latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    model.guess_many(queries[:1])
+    matrix_seconds = time.perf_counter() - start
+    start = time.perf_counter()
+    model.guess_many(queries)
+    many_seconds = time.perf_counter() - start
+
+    path = os.path.join(tempfile.mkdtemp(), 'model.bin')
+    start = time.perf_counter()
+    model.save(path)
+    save_seconds = time.perf_counter() - start
+    start = time.perf_counter()
+    BayesCat.load(path, mmap=True)
+    mmap_seconds = time.perf_counter() - start
+    start = time.perf_counter()
+    BayesCat.load(path, mmap=False)
+    load_seconds = time.perf_counter() - start
+    file_bytes = os.path.getsize(path)
+    os.remove(path)
+    os.rmdir(os.path.dirname(path))
+
+    return {
+        'training': {
+            'seconds': train_seconds,
+            'docs_per_sec': docs / train_seconds,
+            'model_mb': model_bytes / 2 ** 20,
+            'peak_mb': peak_bytes / 2 ** 20,
+        },
+        'features': {
+            'distinct': len(model._index),
+            'category_counts': sum(len(scores) for scores in model._cat_scores.values()),
+            'vocabulary': len(model._vocab),
+        },
+        'guess': dict(percentiles(latencies), per_sec=len(latencies) / sum(latencies)),
+        'guess_many': {'matrix_seconds': matrix_seconds, 'per_sec': len(queries) / many_seconds},
+        'model_file': {
+            'bytes': file_bytes,
+            'save_seconds': save_seconds,
+            'mmap_load_seconds': mmap_seconds,
+            'load_seconds': load_seconds,
+        },
+    }
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description='BayesCat benchmarks')
+    parser.add_argument('bench', nargs='?', default='suite', choices=['suite', 'parallel', 'memory'])
+    parser.add_argument('--docs', type=int, default=50000)
+    parser.add_argument('--vocab', type=int, default=5000)
+    parser.add_argument('--categories', type=int, default=50)
+    parser.add_argument('--guesses', type=int, default=2000)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4, 8])
+    parser.add_argument('--max-ngram', type=int, default=3)
+    parser.add_argument('--output', help='write the results to this json file')
+    args = parser.parse_args()
+
+    if args.bench == 'memory':
+        results = bench_memory(args.docs, seed=args.seed)
+        for row in results:
+            print('%(features)10d features  %(model_mb)8.1f MB (peak %(peak_mb).1f)  '
+                  '%(accuracy).3f acc  %(config)s' % row)
+    elif args.bench == 'parallel':
+        results = bench_parallel(args.docs, args.workers, args.max_ngram, seed=args.seed)
+        for row in results:
+            print('workers %(workers)3d  %(seconds)8.2fs  %(docs_per_sec)10.0f docs/s  '
+                  'x%(speedup).2f' % row)
+    else:
+        results = run_suite(args.docs, args.vocab, args.categories, args.max_ngram,
+                            args.guesses, args.seed)
+        print(json.dumps(results, indent=2))
+
+    if args.output:
+        write_report(args.output, args.bench, args, results)
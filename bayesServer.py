@@ -0,0 +1,306 @@
+# asyncio classification server that micro-batches BayesCat guesses
+
+import asyncio
+import json
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from AIMLaning import BayesCat
+from benchTools import percentiles
+
+_worker_model = None
+
+
+def _init_worker(path):
+    """
+    loads the saved model once per worker process (memory mapped, so workers share it)
+    """
+    global _worker_model
+    _worker_model = BayesCat.load(path, mmap=True)
+
+
+def _guess_batch(texts):
+    return _worker_model.guess_many(texts)
+
+
+class MicroBatcher(object):
+    """
+    queues descriptions and hands them to the model in batches, flushing when a batch
+    is full or the oldest queued description has waited max_delay seconds
+    """
+
+    def __init__(self, model, max_batch=64, max_delay=0.005, workers=1, processes=False,
+                 samples=10000):
+        """
+        input parameter:    model
+        data type:          BayesCat or string
+        description:        trained model, or the path of a model written by BayesCat.save.
+
+        optional input:     max_batch
+        description:        most descriptions per batch.
+
+        optional input:     max_delay
+        description:        seconds a description may wait for its batch to fill.
+
+        optional input:     workers
+        description:        batches scored at the same time.
+
+        optional input:     processes
+        description:        score in a process pool instead of a thread pool. model must
+                            then be a saved model path; each worker maps the same file.
+
+        optional input:     samples
+        description:        number of recent latencies kept for the percentiles.
+        """
+
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+        if processes:
+            self._executor = ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                                 initargs=(model,))
+            self._score = _guess_batch
+        else:
+            if isinstance(model, str):
+                model = BayesCat.load(model, mmap=True)
+            self._executor = ThreadPoolExecutor(max_workers=workers)
+            self._score = model.guess_many
+        self._slots = None
+        self._workers = workers
+        self._pending = deque()
+        self._wakeup = None
+        self._flusher = None
+        self._latencies = deque(maxlen=samples)
+        self.served = 0
+        self.batches = 0
+
+    async def start(self):
+        self._slots = asyncio.Semaphore(self._workers)
+        self._wakeup = asyncio.Event()
+        self._flusher = asyncio.ensure_future(self.__flush_loop())
+
+    async def close(self):
+        if self._flusher is not None:
+            self._flusher.cancel()
+        self._executor.shutdown(wait=True)
+
+    def submit(self, text):
+        """
+        queues one description and returns a future for its category. anything but a
+        string fails on its own future rather than taking its whole batch down with it
+        """
+        future = asyncio.get_running_loop().create_future()
+        if not isinstance(text, str):
+            future.set_exception(TypeError('text must be a string, not %s' % type(text).__name__))
+            return future
+        self._pending.append((text, future, time.perf_counter()))
+        self._wakeup.set()
+        return future
+
+    async def __flush_loop(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            if not self._pending:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+            deadline = self._pending[0][2] + self.max_delay
+            while len(self._pending) < self.max_batch:
+                remaining = deadline - time.perf_counter()
+                if remaining <= 0:
+                    break
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), remaining)
+                except asyncio.TimeoutError:
+                    break
+            batch = [self._pending.popleft()
+                     for _ in range(min(self.max_batch, len(self._pending)))]
+            await self._slots.acquire()
+            task = loop.run_in_executor(self._executor, self._score, [item[0] for item in batch])
+            task.add_done_callback(lambda done, batch=batch: self.__deliver(done, batch))
+
+    def __deliver(self, done, batch):
+        self._slots.release()
+        self.batches += 1
+        now = time.perf_counter()
+        if done.exception() is not None:
+            for _, future, _ in batch:
+                if not future.done():
+                    future.set_exception(done.exception())
+            return
+        for (_, future, queued), category in zip(batch, done.result()):
+            self._latencies.append(now - queued)
+            self.served += 1
+            if not future.done():
+                future.set_result(category)
+
+    def stats(self):
+        """
+        returns queue depth, served / batch counts and p50 / p99 latency in milliseconds
+        """
+        latency = percentiles(self._latencies, (0.5, 0.99))
+        return {
+            'queue_depth': len(self._pending),
+            'served': self.served,
+            'batches': self.batches,
+            'p50_ms': latency.get('p50', 0.0),
+            'p99_ms': latency.get('p99', 0.0),
+        }
+
+
+async def serve(batcher, host='127.0.0.1', port=0, path=None):
+    """
+    input parameter:    batcher
+    data type:          MicroBatcher
+    description:        batcher the connections submit to.
+
+    optional input:     host, port
+    description:        tcp address to listen on. port 0 picks a free port.
+
+    optional input:     path
+    description:        listen on this unix socket instead of tcp.
+
+    speaks newline delimited json. each request line is either
+        {"text": "..."}     answered with {"category": "..."}
+        {"stats": true}     answered with MicroBatcher.stats()
+    requests on one connection may be pipelined; answers come back in order.
+    returns the started asyncio server.
+    """
+
+    await batcher.start()
+
+    async def handle(reader, writer):
+        answers = asyncio.Queue()
+
+        async def respond():
+            while True:
+                answer = await answers.get()
+                if answer is None:
+                    break
+                if asyncio.isfuture(answer):
+                    try:
+                        answer = {'category': await answer}
+                    except Exception as error:
+                        answer = {'error': str(error)}
+                writer.write(json.dumps(answer).encode('utf-8') + b'\n')
+                await writer.drain()
+
+        responder = asyncio.ensure_future(respond())
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                try:
+                    request = json.loads(line)
+                except ValueError:
+                    answers.put_nowait({'error': 'invalid json'})
+                    continue
+                if not isinstance(request, dict):
+                    answers.put_nowait({'error': 'request must be a json object'})
+                elif request.get('stats'):
+                    answers.put_nowait(batcher.stats())
+                elif not isinstance(request.get('text', ''), str):
+                    answers.put_nowait({'error': 'text must be a string'})
+                else:
+                    answers.put_nowait(batcher.submit(request.get('text', '')))
+            answers.put_nowait(None)
+            await responder
+        except asyncio.CancelledError:
+            # the server is shutting down with this connection still open
+            responder.cancel()
+        finally:
+            writer.close()
+
+    if path:
+        return await asyncio.start_unix_server(handle, path=path)
+    return await asyncio.start_server(handle, host=host, port=port)
+
+
+async def load_test(texts, host='127.0.0.1', port=None, path=None, connections=16,
+                    requests=10000):
+    """
+    input parameter:    texts
+    description:        descriptions the generator cycles through.
+
+    optional input:     host, port, path
+    description:        address of a running server (tcp, or unix socket when path is set).
+
+    optional input:     connections, requests
+    description:        concurrent connections and total requests to send.
+
+    sends requests one at a time per connection and returns the client side
+    throughput and p50 / p99 round trip latency in milliseconds, plus the server stats.
+    """
+
+    latencies = []
+
+    async def client(offset, count):
+        if path:
+            reader, writer = await asyncio.open_unix_connection(path)
+        else:
+            reader, writer = await asyncio.open_connection(host, port)
+        for number in range(count):
+            text = texts[(offset + number) % len(texts)]
+            start = time.perf_counter()
+            writer.write(json.dumps({'text': text}).encode('utf-8') + b'\n')
+            await reader.readline()
+            latencies.append(time.perf_counter() - start)
+        writer.close()
+        await writer.wait_closed()
+
+    share, extra = divmod(requests, connections)
+    counts = [share + (number < extra) for number in range(connections)]
+    start = time.perf_counter()
+    await asyncio.gather(*[client(sum(counts[:number]), count)
+                           for number, count in enumerate(counts)])
+    elapsed = time.perf_counter() - start
+
+    if path:
+        reader, writer = await asyncio.open_unix_connection(path)
+    else:
+        reader, writer = await asyncio.open_connection(host, port)
+    writer.write(b'{"stats": true}\n')
+    server_stats = json.loads(await reader.readline())
+    writer.close()
+    await writer.wait_closed()
+
+    latencies.sort()
+    return {
+        'requests': len(latencies),
+        'seconds': elapsed,
+        'requests_per_sec': len(latencies) / elapsed,
+        'p50_ms': latencies[len(latencies) // 2] * 1000,
+        'p99_ms': latencies[min(len(latencies) - 1, int(0.99 * len(latencies)))] * 1000,
+        'server': server_stats,
+    }
+
+
+if __name__ == "__main__":
+
+    import argparse
+    from bayesBench import make_corpus
+
+    parser = argparse.ArgumentParser(description='run the server against a local load generator')
+    parser.add_argument('--docs', type=int, default=20000)
+    parser.add_argument('--requests', type=int, default=20000)
+    parser.add_argument('--connections', type=int, default=32)
+    parser.add_argument('--max-batch', type=int, default=64)
+    parser.add_argument('--max-delay', type=float, default=0.005)
+    args = parser.parse_args()
+
+    category_data, train_data = make_corpus(args.docs)
+    model = BayesCat(category_data, train_data, max_ngram=3)
+
+    async def main():
+        batcher = MicroBatcher(model, max_batch=args.max_batch, max_delay=args.max_delay)
+        server = await serve(batcher)
+        port = server.sockets[0].getsockname()[1]
+        result = await load_test(train_data, port=port, connections=args.connections,
+                                 requests=args.requests)
+        server.close()
+        await server.wait_closed()
+        await batcher.close()
+        print(json.dumps(result, indent=2))
+
+    asyncio.run(main())
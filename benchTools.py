@@ -0,0 +1,57 @@
+# helpers shared by the benchmark scripts
+
+import json
+import os
+import platform
+import subprocess
+import sys
+
+
+def percentiles(samples, shares=(0.5, 0.9, 0.99)):
+    """
+    returns {'p50': ..., ...} in milliseconds for a list of durations in seconds
+    """
+
+    ordered = sorted(samples)
+    if not ordered:
+        return {}
+    return {'p%d' % round(share * 100): ordered[min(len(ordered) - 1, int(share * len(ordered)))]
+            * 1000 for share in shares}
+
+
+def git_commit():
+    """
+    returns the commit the benchmark ran against, so result files can be compared
+    """
+
+    try:
+        return subprocess.check_output(['git', 'rev-parse', 'HEAD'],
+                                       cwd=os.path.dirname(os.path.abspath(__file__)),
+                                       stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def write_report(path, bench, args, results):
+    """
+    input parameter:    path
+    description:        json file the report is written to.
+
+    input parameter:    bench, args, results
+    description:        name of the benchmark run, its parsed command line arguments and
+                        its results.
+
+    writes the results tagged with the git commit, python version and platform, so runs
+    on different commits and machines can be compared.
+    """
+
+    report = {
+        'bench': bench,
+        'commit': git_commit(),
+        'python': sys.version.split()[0],
+        'platform': platform.platform(),
+        'arguments': vars(args),
+        'results': results,
+    }
+    with open(path, 'w') as file:
+        json.dump(report, file, indent=2)
@@ -0,0 +1,465 @@
+# benchmarks for the dataCrunch tables
+
+import argparse
+import csv
+import json
+import os
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import openpyxl
+
+from benchTools import percentiles, write_report
+from dataCrunch import Field, ObjectifyCSV, ObjectifyTable, ObjectifyXL, load_many
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+
+def fixture_rows(rows, columns=6, seed=0):
+    """
+    input parameter:    rows
+    description:        number of data rows.
+    optional input:     columns
+    description:        number of fields. the first six are a unique id, a high cardinality
+                        name, two low cardinality fields (status, region), an integer
+                        amount and an iso date; any more are integer fields extra6, extra7...
+    optional input:     seed
+    description:        seed for the generator; the same arguments always give the same rows.
+
+    yields the header row, then the data rows
+    """
+
+    rng = random.Random(seed)
+    statuses = ['open', 'closed', 'pending', 'void']
+    regions = ['north', 'south', 'east', 'west', 'central']
+    yield (['id', 'name', 'status', 'region', 'amount', 'date'] +
+           ['extra%d' % number for number in range(6, columns)])[:columns]
+    for number in range(rows):
+        row = [number, 'name%d' % rng.randrange(rows), rng.choice(statuses),
+               rng.choice(regions), rng.randrange(100000),
+               '2020-%02d-%02d' % (rng.randint(1, 12), rng.randint(1, 28))]
+        row.extend(rng.randrange(1000) for _ in range(6, columns))
+        yield row[:columns]
+
+
+def make_csv(path, rows, seed=0, columns=6):
+    """
+    writes fixture_rows to a csv
+    """
+
+    with open(path, 'w', newline='') as file:
+        csv.writer(file, lineterminator='\n').writerows(fixture_rows(rows, columns, seed))
+
+
+def make_xlsx(path, rows, seed=0, columns=6):
+    """
+    writes fixture_rows to the first sheet of an xlsx
+    """
+
+    workbook = openpyxl.Workbook(write_only=True)
+    sheet = workbook.create_sheet()
+    for row in fixture_rows(rows, columns, seed):
+        sheet.append(row)
+    workbook.save(path)
+
+
+def legacy_load_csv(path):
+    """
+    loads a csv into the {header: {row: value}} layout the tables used before columns
+    """
+
+    data = {}
+    headers = []
+    with open(path, newline='') as file:
+        for line_count, row in enumerate(csv.reader(file)):
+            if line_count == 0:
+                for header in row:
+                    data[header] = {}
+                    headers.append(header)
+            else:
+                for position, entry in enumerate(row):
+                    data[headers[position]][line_count] = entry
+    return data, headers
+
+
+def legacy_get_by_field(data, headers, filt):
+    """
+    the scan get_by_field ran over the {header: {row: value}} layout
+    """
+
+    keys = set()
+    for header, sets in data.items():
+        for key, value in sets.items():
+            if header in filt:
+                if filt[header] == value:
+                    keys.add(key)
+    return [[data[header][key] for header in headers] for key in keys]
+
+
+def timed(function, *args, **kwargs):
+    start = time.perf_counter()
+    result = function(*args, **kwargs)
+    return result, time.perf_counter() - start
+
+
+def traced(function, *args, **kwargs):
+    """
+    returns (result, seconds, retained bytes, peak bytes) of one call
+    """
+    tracemalloc.start()
+    result, seconds = timed(function, *args, **kwargs)
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, seconds, current, peak
+
+
+def bench_columnar(rows=1000000, seed=0, lookups=5):
+    """
+    compares the {header: {row: value}} layout against the column layout on one
+    generated csv: memory retained after loading and get_by_field time for a low
+    cardinality and a unique key filter. returns a dictionary of the measurements.
+    """
+
+    directory = tempfile.mkdtemp()
+    path = os.path.join(directory, 'columnar.csv')
+    make_csv(path, rows, seed)
+
+    (data, headers), _, legacy_bytes, _ = traced(legacy_load_csv, path)
+    _, legacy_status = timed(lambda: [legacy_get_by_field(data, headers, {'status': 'void'})
+                                      for _ in range(lookups)])
+    _, legacy_key = timed(lambda: [legacy_get_by_field(data, headers, {'id': str(rows // 2)})
+                                   for _ in range(lookups)])
+    del data
+
+    table, load_seconds, column_bytes, _ = traced(ObjectifyCSV, path)
+    _, column_status = timed(lambda: [table.get_by_field({'status': 'void'})
+                                      for _ in range(lookups)])
+    _, column_key = timed(lambda: [table.get_by_field({'id': str(rows // 2)})
+                                   for _ in range(lookups)])
+
+    os.remove(path)
+    os.rmdir(directory)
+    return {
+        'rows': rows,
+        'legacy_mb': legacy_bytes / 2 ** 20,
+        'columnar_mb': column_bytes / 2 ** 20,
+        'load_seconds': load_seconds,
+        'legacy_status_lookup_seconds': legacy_status / lookups,
+        'columnar_status_lookup_seconds': column_status / lookups,
+        'legacy_key_lookup_seconds': legacy_key / lookups,
+        'columnar_key_lookup_seconds': column_key / lookups,
+        'encoded_fields': [header for header in table.headers if table.data[header].encoded],
+    }
+
+
+def bench_many(files=32, rows=50000, workers=(1, 2, 4, 8), seed=0):
+    """
+    times load_many over a directory of generated csv files at each worker count and
+    returns a list of {'workers', 'seconds', 'rows_per_sec', 'speedup'} rows.
+    the first row is the old nightly job: one ObjectifyCSV per file, serially.
+    """
+
+    directory = tempfile.mkdtemp()
+    paths = [os.path.join(directory, 'drop%03d.csv' % number) for number in range(files)]
+    for number, path in enumerate(paths):
+        make_csv(path, rows, seed + number)
+
+    _, serial = timed(lambda: [ObjectifyCSV(path) for path in paths])
+    results = [{'workers': 0, 'seconds': serial, 'rows_per_sec': files * rows / serial,
+                'speedup': 1.0}]
+    for count in workers:
+        _, elapsed = timed(load_many, directory, count)
+        results.append({'workers': count, 'seconds': elapsed,
+                        'rows_per_sec': files * rows / elapsed, 'speedup': serial / elapsed})
+
+    shutil.rmtree(directory)
+    return results
+
+
+def scan(table, test):
+    """
+    the python loop a range or prefix filter takes without query: test every row, then
+    collect the matching rows in the get_by_field layout
+    """
+
+    columns = [table.data[header].values_list() for header in table.headers]
+    return [list(row) for row in zip(*columns) if test(row)]
+
+
+def bench_query(rows=1000000, seed=0, repeats=3):
+    """
+    times query against a python scan over the same table for a set of filters and
+    returns {filter name: {'matches', 'scan_seconds', 'query_seconds', 'mask_seconds',
+    'speedup'}}, where mask_seconds is the condition alone, without building the rows,
+    plus the one time cost of parsing the typed columns under 'typing_seconds'.
+    equality on a low cardinality field is also timed through get_by_field.
+    """
+
+    directory = tempfile.mkdtemp()
+    path = os.path.join(directory, 'query.csv')
+    make_csv(path, rows, seed)
+    table = ObjectifyCSV(path)
+    shutil.rmtree(directory)
+
+    _, typing_seconds = timed(lambda: [table.column_type(header) for header in table.headers])
+    cases = {
+        'amount range': (Field('amount').between(25000, 30000),
+                         lambda row: 25000 <= int(row[4]) <= 30000),
+        'date after': (Field('date') >= '2020-11-01',
+                       lambda row: row[5] >= '2020-11-01'),
+        'status in': (Field('status').isin(['open', 'void']),
+                      lambda row: row[2] in ('open', 'void')),
+        'name prefix': (Field('name').startswith('name99'),
+                        lambda row: row[1].startswith('name99')),
+        'compound': ((Field('amount') > 90000) & (Field('region') == 'east') |
+                     ~Field('status').isin(['open', 'closed', 'pending']),
+                     lambda row: int(row[4]) > 90000 and row[3] == 'east' or
+                     row[2] not in ('open', 'closed', 'pending')),
+    }
+
+    results = {'rows': rows, 'typing_seconds': typing_seconds}
+    for name, (predicate, test) in cases.items():
+        expected, scan_seconds = timed(lambda: [scan(table, test) for _ in range(repeats)])
+        found, query_seconds = timed(lambda: [table.query(predicate) for _ in range(repeats)])
+        _, mask_seconds = timed(lambda: [table.mask(predicate) for _ in range(repeats)])
+        assert found[0] == expected[0], name
+        results[name] = {'matches': len(found[0]), 'scan_seconds': scan_seconds / repeats,
+                         'query_seconds': query_seconds / repeats,
+                         'mask_seconds': mask_seconds / repeats,
+                         'speedup': scan_seconds / query_seconds}
+
+    _, equal_seconds = timed(lambda: [table.get_by_field({'status': 'void'})
+                                      for _ in range(repeats)])
+    _, query_seconds = timed(lambda: [table.query(Field('status') == 'void')
+                                      for _ in range(repeats)])
+    results['status equal'] = {'get_by_field_seconds': equal_seconds / repeats,
+                               'query_seconds': query_seconds / repeats}
+    return results
+
+
+def bench_join(rows=200000, keys=200, seed=0):
+    """
+    times join and group_by against the per key get_by_field loops they replace, on a
+    generated csv and a reference table of keys names. returns a dictionary of seconds.
+    """
+
+    directory = tempfile.mkdtemp()
+    path = os.path.join(directory, 'join.csv')
+    make_csv(path, rows, seed)
+    table = ObjectifyCSV(path)
+    rng = random.Random(seed)
+    reference = ObjectifyTable(['name', 'owner'],
+                               [['name%d' % rng.randrange(rows), 'owner%d' % number]
+                                for number in range(keys)])
+
+    def per_key_join():
+        joined = []
+        for name, owner in zip(reference.data['name'].values_list(),
+                               reference.data['owner'].values_list()):
+            joined.extend(row + [owner] for row in table.get_by_field({'name': name}))
+        return joined
+
+    def per_key_group():
+        groups = []
+        for status in set(table.data['status'].values_list()):
+            amounts = [int(row[0]) for row in table.get_by_field({'status': status}, ['amount'])]
+            groups.append([status, len(amounts), sum(amounts), min(amounts), max(amounts),
+                           sum(amounts) / len(amounts)])
+        return groups
+
+    aggregates = {'amount': ['sum', 'min', 'max', 'mean']}
+    expected, loop_join = timed(per_key_join)
+    joined, hash_join = timed(table.join, reference, 'name')
+    assert joined.total_entries == len(expected)
+    _, loop_group = timed(per_key_group)
+    _, group = timed(table.group_by, 'status', aggregates)
+    _, name_group = timed(table.group_by, 'name', aggregates)
+    _, streamed = timed(ObjectifyCSV.group_by_path, path, 'status', aggregates)
+    shutil.rmtree(directory)
+    return {
+        'rows': rows,
+        'keys': keys,
+        'per_key_join_seconds': loop_join,
+        'hash_join_seconds': hash_join,
+        'per_key_group_seconds': loop_group,
+        'group_by_seconds': group,
+        'group_by_unique_name_seconds': name_group,
+        'group_by_path_seconds': streamed,
+    }
+
+
+def peak_rss_mb():
+    """
+    peak resident memory of this process in MB, None where resource is not available
+    """
+
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on linux, bytes on macOS
+    return peak / (2 ** 20 if sys.platform == 'darwin' else 2 ** 10)
+
+
+def bench_case(kind, path, rows, lookups=200, writes=200):
+    """
+    input parameter:    kind
+    description:        'csv' or 'xlsx'.
+    input parameter:    path, rows
+    description:        fixture to measure and its number of rows. the writes change it.
+    optional input:     lookups, writes
+    description:        get_by_field calls per filter, and rows written per write path.
+
+    measures one fixture in this process and returns a dictionary:
+        load_seconds:       constructing the table
+        filter:             get_by_field latency percentiles in ms for a low cardinality
+                            field, a unique key and an 'and' of two fields
+        write:              rows per second through write_to_file one row per call (each
+                            call saves the whole workbook for xlsx, so only a few are made)
+                            and through one batched writer / session
+        peak_rss_mb:        peak memory of the process
+    """
+
+    loader = ObjectifyCSV if kind == 'csv' else ObjectifyXL
+    table, load_seconds = timed(loader, path)
+    rng = random.Random(rows)
+
+    filters = {
+        'status': lambda: {'status': rng.choice(['open', 'closed', 'pending', 'void'])},
+        'id': lambda: {'id': str(rng.randrange(rows)) if kind == 'csv' else rng.randrange(rows)},
+        'status_and_region': lambda: {'status': 'open', 'region': rng.choice(['north', 'east'])},
+    }
+    filter_results = {}
+    for name, make_filter in filters.items():
+        mode = 'and' if name == 'status_and_region' else 'or'
+        # the scans are much slower than the unique key, fewer samples keep cases short
+        count = lookups if name == 'id' else max(1, lookups // 10)
+        samples = [timed(table.get_by_field, make_filter(), None, mode)[1]
+                   for _ in range(count)]
+        filter_results[name] = percentiles(samples)
+
+    single = writes if kind == 'csv' else min(writes, 3)
+    start = time.perf_counter()
+    for number in range(single):
+        if kind == 'csv':
+            table.write_to_file({'id': str(rows + number)})
+        else:
+            table.write_to_file({'id': [rows + number]})
+    single_seconds = time.perf_counter() - start
+    start = time.perf_counter()
+    if kind == 'csv':
+        with table.writer() as writer:
+            for number in range(writes):
+                writer.add({'id': str(rows + single + number), 'status': 'open'})
+    else:
+        with table.batch() as session:
+            for number in range(writes):
+                session.write_to_file({'id': [rows + single + number], 'status': ['open']})
+    batch_seconds = time.perf_counter() - start
+
+    return {
+        'load_seconds': load_seconds,
+        'load_rows_per_sec': rows / load_seconds if load_seconds else None,
+        'filter_ms': filter_results,
+        'write': {
+            'single_rows_per_sec': single / single_seconds,
+            'batch_rows_per_sec': writes / batch_seconds,
+        },
+        'peak_rss_mb': peak_rss_mb(),
+    }
+
+
+def run_suite(sizes=(1000, 10000, 100000), columns=(6, 24), kinds=('csv', 'xlsx'), seed=0,
+              lookups=200, writes=200):
+    """
+    input parameter:    sizes, columns, kinds
+    description:        every combination of row count, field count and file type is a case.
+    optional input:     seed
+    description:        seed for the fixtures.
+    optional input:     lookups, writes
+    description:        see bench_case.
+
+    generates each fixture in a temporary directory and measures it in a fresh python
+    process (so peak_rss_mb belongs to that case alone). returns a list of
+    {'kind', 'rows', 'columns', 'file_mb', ...bench_case results} dictionaries.
+    """
+
+    directory = tempfile.mkdtemp()
+    results = []
+    try:
+        for kind in kinds:
+            for count in columns:
+                for rows in sizes:
+                    path = os.path.join(directory, 'fixture_%d_%d.%s' % (rows, count, kind))
+                    (make_csv if kind == 'csv' else make_xlsx)(path, rows, seed, count)
+                    size = os.path.getsize(path)
+                    output = subprocess.check_output(
+                        [sys.executable, os.path.abspath(__file__), 'case', '--kind', kind,
+                         '--path', path, '--rows', str(rows), '--lookups', str(lookups),
+                         '--writes', str(writes)])
+                    case = {'kind': kind, 'rows': rows, 'columns': count,
+                            'file_mb': size / 2 ** 20}
+                    case.update(json.loads(output))
+                    results.append(case)
+                    os.remove(path)
+    finally:
+        shutil.rmtree(directory)
+    return results
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description='dataCrunch benchmarks')
+    parser.add_argument('bench', nargs='?', default='columnar',
+                        choices=['columnar', 'many', 'query', 'join', 'suite', 'case'])
+    parser.add_argument('--rows', type=int, default=1000000)
+    parser.add_argument('--files', type=int, default=32)
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4, 8])
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000, 100000])
+    parser.add_argument('--columns', type=int, nargs='+', default=[6, 24])
+    parser.add_argument('--kinds', nargs='+', default=['csv', 'xlsx'], choices=['csv', 'xlsx'])
+    parser.add_argument('--lookups', type=int, default=200)
+    parser.add_argument('--writes', type=int, default=200)
+    parser.add_argument('--kind', choices=['csv', 'xlsx'], help='case: fixture type')
+    parser.add_argument('--path', help='case: fixture to measure')
+    parser.add_argument('--output', help='write the results to this json file')
+    args = parser.parse_args()
+
+    if args.bench == 'case':
+        # one suite case, run by run_suite in its own process
+        print(json.dumps(bench_case(args.kind, args.path, args.rows, args.lookups, args.writes)))
+        sys.exit()
+    if args.bench == 'many':
+        results = bench_many(args.files, args.rows, args.workers, args.seed)
+        for row in results:
+            print('workers %(workers)3d  %(seconds)8.2fs  %(rows_per_sec)10.0f rows/s  '
+                  'x%(speedup).2f' % row)
+    elif args.bench == 'query':
+        results = bench_query(args.rows, args.seed)
+        for name, value in results.items():
+            print('%-16s %s' % (name, value))
+    elif args.bench == 'join':
+        results = bench_join(args.rows, seed=args.seed)
+        for name, value in results.items():
+            print('%-32s %s' % (name, value))
+    elif args.bench == 'suite':
+        results = run_suite(args.sizes, args.columns, args.kinds, args.seed, args.lookups,
+                            args.writes)
+        for case in results:
+            print('%(kind)-5s %(rows)8d rows %(columns)3d fields  load %(load_seconds)8.3fs  '
+                  'peak %(peak_rss_mb)7.1f MB' % case)
+    else:
+        results = bench_columnar(args.rows, args.seed)
+        for name, value in results.items():
+            print('%-32s %s' % (name, value))
+
+    if args.output:
+        write_report(args.output, args.bench, args, results)
@@ -1,13 +1,1007 @@
 import csv
+import datetime
+import glob
+import hashlib
+import io
+import locale
+import math
+import mmap
+import os
+import pickle
+import zlib
+from array import array
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+
 import openpyxl
 
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+
+class Column(object):
+    """
+    one column of a table, keyed by row number starting at 1.
+    behaves like the {row: value} dictionary it replaces, but keeps the values in a
+    list, or dictionary encoded (an array of small integer codes into the distinct
+    values) while the column has few distinct values.
+    """
+
+    # a column stops being dictionary encoded once it has more distinct values than
+    # this and more than half of its values are distinct
+    encode_limit = 1024
+
+    def __init__(self, values=None, encode=True):
+        """
+        optional input:     values
+        description:        initial values, for rows 1, 2, 3...
+        optional input:     encode
+        description:        start dictionary encoded. defaults to True.
+        """
+
+        self._values = None
+        self._codes = None
+        self._distinct = None
+        self._lookup = None
+        if encode:
+            self._codes = array('B')
+            self._distinct = []
+            self._lookup = {}
+        else:
+            self._values = []
+        if values:
+            self.extend(values)
+
+    @property
+    def encoded(self):
+        return self._codes is not None
+
+    def append(self, value):
+        if self._codes is None:
+            self._values.append(value)
+            return
+        # strings are their own key; anything else carries its type so 1, 1.0 and True
+        # keep their own values
+        key = value if type(value) is str else (type(value), value)
+        code = self._lookup.get(key)
+        if code is None:
+            code = len(self._distinct)
+            if code > self.encode_limit and code * 2 > len(self._codes):
+                self.decode()
+                self._values.append(value)
+                return
+            self._lookup[key] = code
+            self._distinct.append(value)
+            if code == 256 and self._codes.typecode == 'B':
+                self._codes = array('H', self._codes)
+            elif code == 65536 and self._codes.typecode == 'H':
+                self._codes = array('I', self._codes)
+        self._codes.append(code)
+
+    def extend(self, values):
+        """
+        appends many values; the bulk path the loaders use
+        """
+        if isinstance(values, Column):
+            self.__extend_column__(values)
+            return
+        if self._codes is None:
+            self._values.extend(values)
+            return
+        lookup = self._lookup
+        try:
+            # fast path: every value is a string that already has a code
+            self._codes.extend([lookup[value] for value in values])
+            return
+        except (KeyError, TypeError):
+            pass
+        for position, value in enumerate(values):
+            code = lookup.get(value if type(value) is str else (type(value), value))
+            if code is None:
+                self.append(value)
+                if self._codes is None:
+                    self._values.extend(values[position + 1:])
+                    return
+            else:
+                self._codes.append(code)
+
+    def __extend_column__(self, other):
+        """
+        appends another column. two encoded columns merge by translating codes, so each
+        distinct value is looked up once instead of once per row.
+        """
+        if self._codes is None or other._codes is None:
+            self.extend(other.values_list())
+            return
+        lookup = self._lookup
+        length = len(self._codes) + len(other._codes)
+        remap = []
+        for value in other._distinct:
+            key = value if type(value) is str else (type(value), value)
+            code = lookup.get(key)
+            if code is None:
+                code = len(self._distinct)
+                if code > self.encode_limit and code * 2 > length:
+                    self.extend(other.values_list())
+                    return
+                lookup[key] = code
+                self._distinct.append(value)
+            remap.append(code)
+        if len(self._distinct) > 65536 and self._codes.typecode != 'I':
+            self._codes = array('I', self._codes)
+        elif len(self._distinct) > 256 and self._codes.typecode == 'B':
+            self._codes = array('H', self._codes)
+        self._codes.extend([remap[code] for code in other._codes])
+
+    def decode(self):
+        """
+        switches the column to a plain list of values
+        """
+        if self._codes is not None:
+            distinct = self._distinct
+            self._values = [distinct[code] for code in self._codes]
+            self._codes = self._distinct = self._lookup = None
+
+    def values_list(self):
+        """
+        returns the values in row order as a new list
+        """
+        if self._codes is None:
+            return list(self._values)
+        distinct = self._distinct
+        return [distinct[code] for code in self._codes]
+
+    def take(self, keys):
+        """
+        returns the values of the provided row keys, in order
+        """
+        if self._codes is None:
+            values = self._values
+            return [values[key - 1] for key in keys]
+        distinct = self._distinct
+        codes = self._codes
+        return [distinct[codes[key - 1]] for key in keys]
+
+    def find(self, value):
+        """
+        returns the row keys whose value equals the provided value, in row order
+        """
+        if self._codes is None:
+            return [key for key, entry in enumerate(self._values, 1) if entry == value]
+        matches = {code for code, entry in enumerate(self._distinct) if entry == value}
+        if not matches:
+            return []
+        if len(matches) == 1:
+            match = matches.pop()
+            return [key for key, code in enumerate(self._codes, 1) if code == match]
+        return [key for key, code in enumerate(self._codes, 1) if code in matches]
+
+    def to_numpy(self, codes=False):
+        """
+        returns the column as a numpy array. with codes=True, a dictionary encoded column
+        returns (codes, distinct values) instead, where codes is a view of the stored array.
+        """
+        if codes and self._codes is not None:
+            return np.frombuffer(self._codes, dtype=self._codes.typecode), \
+                np.array(self._distinct, dtype=object)
+        return np.array(self.values_list())
+
+    def __len__(self):
+        if self._codes is None:
+            return len(self._values)
+        return len(self._codes)
+
+    def __getitem__(self, key):
+        if not isinstance(key, int) or key < 1 or key > len(self):
+            raise KeyError(key)
+        if self._codes is None:
+            return self._values[key - 1]
+        return self._distinct[self._codes[key - 1]]
+
+    def __setitem__(self, key, value):
+        length = len(self)
+        if key == length + 1:
+            self.append(value)
+        elif 1 <= key <= length:
+            if self._codes is None:
+                self._values[key - 1] = value
+            else:
+                # rewrite through a fresh append so a new value gets a code
+                self.append(value)
+                if self._codes is None:
+                    self._values[key - 1] = self._values.pop()
+                else:
+                    self._codes[key - 1] = self._codes.pop()
+        else:
+            while len(self) < key - 1:
+                self.append(None)
+            self.append(value)
+
+    def __contains__(self, key):
+        return isinstance(key, int) and 1 <= key <= len(self)
+
+    def __iter__(self):
+        return iter(range(1, len(self) + 1))
+
+    def keys(self):
+        return range(1, len(self) + 1)
+
+    def values(self):
+        return self.values_list()
+
+    def items(self):
+        return zip(self.keys(), self.values_list())
+
+    def get(self, key, default=None):
+        if key in self:
+            return self[key]
+        return default
+
+    def __eq__(self, other):
+        if isinstance(other, (Column, dict)):
+            return dict(self.items()) == dict(other.items())
+        return NotImplemented
+
+    def __repr__(self):
+        return repr(dict(self.items()))
+
+    def __getstate__(self):
+        # the lookup is rebuilt from the distinct values, keeping pickles small
+        # for the process pool in load_many
+        state = self.__dict__.copy()
+        state['_lookup'] = None
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        if self._distinct is not None:
+            self._lookup = {value if type(value) is str else (type(value), value): code
+                            for code, value in enumerate(self._distinct)}
+
+
+def _parse_int(value):
+    if type(value) is bool or type(value) is float:
+        raise ValueError(value)
+    value = int(value)
+    if not -(1 << 63) <= value < 1 << 63:
+        # python ints have no limit, int64 columns do
+        raise OverflowError(value)
+    return value
+
+
+def _parse_float(value):
+    if type(value) is bool:
+        raise ValueError(value)
+    return float(value)
+
+
+def _parse_date(value):
+    if type(value) is datetime.date:
+        return datetime.datetime(value.year, value.month, value.day)
+    if type(value) is datetime.datetime:
+        return value
+    return datetime.datetime.fromisoformat(value)
+
+
+def _parse_or_none(parse, value):
+    try:
+        return parse(value)
+    except (TypeError, ValueError, OverflowError):
+        return None
+
+
+_PARSERS = {'int': _parse_int, 'float': _parse_float, 'date': _parse_date, 'str': str}
+_DTYPES = {'int': 'int64', 'float': 'float64', 'date': 'datetime64[s]', 'str': 'U'}
+_FILLS = {'int': 0, 'float': 0.0, 'date': datetime.datetime(1970, 1, 1), 'str': ''}
+
+
+class Predicate(object):
+    """
+    a condition on table rows. combine with & (and), | (or) and ~ (not).
+    """
+
+    def __init__(self, evaluate):
+        """
+        input parameter:    evaluate
+        description:        function taking an ObjectifyTable and returning a numpy
+                            boolean array with one entry per row
+        """
+        self.evaluate = evaluate
+
+    def __and__(self, other):
+        return Predicate(lambda table: self.evaluate(table) & other.evaluate(table))
+
+    def __or__(self, other):
+        return Predicate(lambda table: self.evaluate(table) | other.evaluate(table))
+
+    def __invert__(self):
+        return Predicate(lambda table: ~self.evaluate(table))
+
+
+class Field(object):
+    """
+    names a field in a query; comparing it builds a Predicate. the compared value is
+    parsed to the field's type, so Field('date') >= '2020-06-01' compares dates.
+    """
+
+    def __init__(self, name):
+        self.name = name
+
+    def __compare__(self, compare, value):
+        def evaluate(table):
+            kind, values, present, codes = table.__typed__(self.name)
+            return _rows(compare(values, _convert(kind, value)) & present, codes)
+        return Predicate(evaluate)
+
+    def __eq__(self, value):
+        return self.__compare__(np.equal, value)
+
+    def __ne__(self, value):
+        return self.__compare__(np.not_equal, value)
+
+    def __lt__(self, value):
+        return self.__compare__(np.less, value)
+
+    def __le__(self, value):
+        return self.__compare__(np.less_equal, value)
+
+    def __gt__(self, value):
+        return self.__compare__(np.greater, value)
+
+    def __ge__(self, value):
+        return self.__compare__(np.greater_equal, value)
+
+    __hash__ = object.__hash__
+
+    def between(self, low, high):
+        """
+        low <= value <= high
+        """
+        return (self >= low) & (self <= high)
+
+    def isin(self, values):
+        def evaluate(table):
+            kind, column, present, codes = table.__typed__(self.name)
+            wanted = [_convert(kind, value) for value in values]
+            if not wanted:
+                return _rows(np.zeros(len(column), dtype=bool), codes)
+            # the query values keep their own dtype: casting them to the column's would
+            # cut 'abc' to fit a <U2 column and turn 1.5 into 1 in an int one
+            return _rows(np.isin(column, np.array(wanted)) & present, codes)
+        return Predicate(evaluate)
+
+    def startswith(self, prefix):
+        """
+        compares the values as text, whatever the field's type
+        """
+        def evaluate(table):
+            kind, values, present, codes = table.__typed__(self.name)
+            if kind == 'str':
+                return _rows(np.char.startswith(values, prefix) & present, codes)
+            column = table.data[self.name]
+            values = column._distinct if column.encoded else column.values_list()
+            hits = np.array([value is not None and str(value).startswith(prefix)
+                             for value in values], dtype=bool)
+            return _rows(hits, codes)
+        return Predicate(evaluate)
+
+    def isnull(self):
+        """
+        rows where the value is missing ('' or None) or does not parse as the field's type
+        """
+        def evaluate(table):
+            _, _, present, codes = table.__typed__(self.name)
+            return _rows(~present, codes)
+        return Predicate(evaluate)
+
+
+def _rows(result, codes):
+    """
+    expands a result over distinct values to one entry per row
+    """
+    return result if codes is None else result[codes]
+
+
+def _convert(kind, value):
+    """
+    parses a query value to a column's type. raises ValueError when it does not parse
+    """
+    try:
+        if kind == 'date':
+            return np.datetime64(_parse_date(value), 's')
+        if kind == 'str':
+            return str(value)
+        if type(value) is str:
+            return _parse_float(value) if kind == 'float' or '.' in value else _parse_int(value)
+        if kind == 'int' and type(value) is int:
+            return _parse_int(value)
+        return value
+    except (TypeError, ValueError, OverflowError):
+        raise ValueError('query value %r does not parse as %s' % (value, kind))
+
+
+def _number(value):
+    """
+    returns value as an int or float for sum and mean, or None when it is not a number.
+    text is read strictly: int() and float() would also take '1_000', 'nan' and 'inf'
+    """
+    kind = type(value)
+    if kind is int:
+        return value
+    if kind is float:
+        return value if math.isfinite(value) else None
+    if kind is str:
+        if '_' in value:
+            return None
+        try:
+            return int(value)
+        except ValueError:
+            try:
+                number = float(value)
+            except ValueError:
+                return None
+            return number if math.isfinite(number) else None
+    return None
+
+
+def _order(value):
+    """
+    sort key for min and max: numbers (text that parses as one included), then dates,
+    then everything else as text, so a mixed field never compares across types
+    """
+    number = _number(value)
+    if number is not None:
+        return 0, number
+    if isinstance(value, (datetime.date, datetime.datetime)):
+        return 1, datetime.datetime(value.year, value.month, value.day) \
+            if type(value) is datetime.date else value
+    return 2, str(value)
+
+
+class GroupBy(object):
+    """
+    running count, sum, min, max and mean per group, fed a chunk of columns at a time,
+    so a group by over a file never needs the whole file in memory
+    """
+
+    operations = ('count', 'sum', 'min', 'max', 'mean')
+
+    def __init__(self, by, aggregates=None):
+        """
+        input parameter:    by
+        description:        field, or list of fields, whose values make up a group
+        optional input:     aggregates
+        description:        dictionary of field: list of operations, e.g.
+                            {'amount': ['sum', 'mean']}. every group also gets a count.
+        """
+
+        self.by = [by] if isinstance(by, str) else list(by)
+        self.aggregates = [(field, operation) for field, operations in (aggregates or {}).items()
+                           for operation in operations]
+        self.fields = list(dict.fromkeys(field for field, _ in self.aggregates))
+        self._groups = {}
+
+    def check(self, headers):
+        """
+        prints what is wrong with the fields and operations and returns False, else True
+        """
+        for field in self.by + self.fields:
+            if field not in headers:
+                print('error, no field', field)
+                return False
+        for _, operation in self.aggregates:
+            if operation not in self.operations:
+                print('error, unknown operation', operation, 'expected one of', self.operations)
+                return False
+        return True
+
+    def add(self, columns):
+        """
+        input parameter:    columns
+        description:        dictionary of field: list of values, every list the same length,
+                            holding at least the by fields and the aggregated fields
+        """
+
+        groups = self._groups
+        width = len(self.fields)
+        if len(self.by) == 1:
+            keys = zip(columns[self.by[0]])
+        else:
+            keys = zip(*[columns[field] for field in self.by])
+        values = [columns[field] for field in self.fields]
+        for position, key in enumerate(keys):
+            # per group: count, then per field [values seen, numbers seen, total, lowest,
+            # highest]. count counts every value present, sum and mean only the numbers
+            state = groups.get(key)
+            if state is None:
+                state = groups[key] = [0] + [[0, 0, 0, None, None] for _ in range(width)]
+            state[0] += 1
+            for number in range(width):
+                value = values[number][position]
+                if value is None or value == '':
+                    continue
+                running = state[number + 1]
+                running[0] += 1
+                amount = _number(value)
+                if amount is not None:
+                    running[1] += 1
+                    running[2] += amount
+                    order = (0, amount)
+                else:
+                    order = _order(value)
+                if running[3] is None or order < running[3][0]:
+                    running[3] = (order, value)
+                if running[4] is None or order > running[4][0]:
+                    running[4] = (order, value)
+
+    def table(self):
+        """
+        returns the groups as an ObjectifyTable, in the order they were first seen, with
+        the by fields, count, then one field per aggregate named field_operation
+        """
+
+        positions = {field: number + 1 for number, field in enumerate(self.fields)}
+        headers = self.by + ['count'] + ['%s_%s' % aggregate for aggregate in self.aggregates]
+        rows = []
+        for key, state in self._groups.items():
+            row = list(key) + [state[0]]
+            for field, operation in self.aggregates:
+                present, seen, total, low, high = state[positions[field]]
+                if operation == 'count':
+                    row.append(present)
+                elif operation == 'sum':
+                    row.append(total if seen else None)
+                elif operation == 'mean':
+                    row.append(total / seen if seen else None)
+                elif operation == 'min':
+                    row.append(None if low is None else low[1])
+                else:
+                    row.append(None if high is None else high[1])
+            rows.append(row)
+        table = ObjectifyTable(headers)
+        table.extend_rows(rows)
+        return table
+
+
+class ObjectifyTable(object):
+    """
+    table held as {header: Column}, the layout ObjectifyXL and ObjectifyCSV load into
+    """
+
+    def __init__(self, headers=None, rows=None):
+        """
+        optional input:     headers
+        description:        field names of the table
+        optional input:     rows
+        description:        lists of values in header order
+        """
+
+        self.data = {}
+        self.headers = []
+        self.total_entries = 0
+        self._positions = {}
+        self._indexes = {}
+        self._types = {}
+        self._arrays = {}
+        for header in headers or []:
+            self.add_field(header)
+        for row in rows or []:
+            self.append_row(row)
+
+    def add_field(self, header):
+        """
+        adds an empty field. a repeated header name keeps the later position's values.
+        """
+        self._positions[header] = len(self.headers)
+        self.headers.append(header)
+        self.data[header] = Column()
+        self._arrays.pop(header, None)
+
+    def append_row(self, row):
+        """
+        adds a row (list of values in header order); missing trailing values are None
+        """
+        self.extend_rows([row])
+
+    def extend_rows(self, rows):
+        """
+        adds a list of rows, one column at a time
+        """
+        width = len(self.headers)
+        rows = [row if len(row) == width else
+                (list(row) + [None] * width)[:width] for row in rows]
+        if not rows:
+            return
+        columns = list(zip(*rows))
+        start = self.total_entries + 1
+        self._arrays.clear()
+        for header, position in self._positions.items():
+            self.data[header].extend(columns[position])
+            if header in self._indexes:
+                index = self._indexes[header]
+                for key, value in enumerate(columns[position], start):
+                    index.setdefault(value, []).append(key)
+        self.total_entries += len(rows)
+
+    def set_value(self, header, key, value):
+        """
+        overwrites one cell in memory, keeping any index on the field in sync
+        """
+        column = self.data[header]
+        self._arrays.pop(header, None)
+        index = self._indexes.get(header)
+        if index is not None and key in column:
+            old = column[key]
+            index[old].remove(key)
+            if not index[old]:
+                del index[old]
+        column[key] = value
+        if index is not None:
+            index.setdefault(value, []).append(key)
+
+    def create_index(self, field):
+        """
+        input parameter:    field
+        description:        field to index. get_by_field answers filters on an indexed field
+                            from the index instead of scanning the column; appends and
+                            overwrites through write_to_file keep it up to date.
+        """
+        index = {}
+        for key, value in self.data[field].items():
+            index.setdefault(value, []).append(key)
+        self._indexes[field] = index
+
+    def drop_index(self, field):
+        self._indexes.pop(field, None)
+
+    def get_by_field(self, filt, return_fields=None, mode='or'):
+        """
+        input parameter:    filt
+        description:        dictionary that matches field names to a value that we filter by
+        optional input:     return_fields
+        description:        use if only specific fields are wanted to be returned.
+                            defaults to returning all fields.
+        optional input:     mode
+        description:        'or' returns rows matching any of the filters (the default),
+                            'and' returns rows matching all of them.
+        """
+
+        if return_fields is None:
+            return_fields = self.headers
+
+        matches = []
+        for header, value in filt.items():
+            if header in self._indexes:
+                matches.append(self._indexes[header].get(value, ()))
+            elif header in self.data:
+                matches.append(self.data[header].find(value))
+            elif mode == 'and':
+                # no row can match a field the table does not have
+                matches.append(())
+
+        if not matches:
+            keys = []
+        elif mode == 'and':
+            matches.sort(key=len)
+            keys = set(matches[0])
+            for postings in matches[1:]:
+                keys.intersection_update(postings)
+            keys = sorted(keys)
+        else:
+            keys = set()
+            for postings in matches:
+                keys.update(postings)
+            keys = sorted(keys)
+        columns = [self.data[header].take(keys) for header in return_fields]
+        return [list(row) for row in zip(*columns)] if columns else [[] for _ in keys]
+
+    def to_numpy(self, field):
+        """
+        returns one field as a numpy array (numpy is optional and only needed here)
+        """
+        return self.data[field].to_numpy()
+
+    def set_type(self, field, kind=None):
+        """
+        input parameter:    field
+        description:        field whose type query uses
+        optional input:     kind
+        description:        'int', 'float', 'date' or 'str'. None goes back to inferring.
+        """
+        if kind not in _PARSERS and kind is not None:
+            print('error, unknown type', kind, 'expected one of', sorted(_PARSERS))
+            return False
+        if kind is None:
+            self._types.pop(field, None)
+        else:
+            self._types[field] = kind
+        self._arrays.pop(field, None)
+        return True
+
+    def column_type(self, field):
+        """
+        returns the type query compares the field as: the one given to set_type, else
+        the first of int, float, date that every value parses as ('' and None are
+        missing and don't count), else 'str'
+        """
+        return self.__typed__(field)[0]
+
+    def __typed__(self, field):
+        """
+        returns (kind, values, present, codes) for a field, built once and kept until
+        the table changes: values is a numpy array of the parsed values and present marks
+        the ones that are not missing or unparsable. for an encoded column they hold the
+        distinct values and codes maps rows onto them, so conditions are tested once per
+        distinct value; otherwise codes is None and they hold one entry per row.
+        """
+
+        typed = self._arrays.get(field)
+        if typed is not None:
+            return typed
+        column = self.data[field]
+        encoded = column.encoded
+        # an encoded column only parses its distinct values
+        values = column._distinct if encoded else column.values_list()
+
+        kinds = [self._types[field]] if field in self._types else ['int', 'float', 'date']
+        parsed = None
+        for kind in kinds:
+            if kind == 'str':
+                break
+            parse = _PARSERS[kind]
+            try:
+                parsed = [None if value is None or value == '' else parse(value)
+                          for value in values]
+                break
+            except (TypeError, ValueError, OverflowError) as error:
+                if field in self._types:
+                    # an explicit type keeps going, with unparsable values as missing
+                    parsed = [_parse_or_none(parse, value) for value in values]
+                    break
+                if isinstance(error, OverflowError):
+                    # whole numbers too long for int64 are ids, kept as text, not floats
+                    break
+        if parsed is None:
+            kind = 'str'
+            parsed = [None if value is None or value == '' else str(value) for value in values]
+
+        present = np.array([value is not None for value in parsed], dtype=bool)
+        fill = _FILLS[kind]
+        array_values = np.array([fill if value is None else value for value in parsed],
+                                dtype=_DTYPES[kind])
+        # a copy, a view would stop the column's array from growing
+        codes = np.array(column.to_numpy(codes=True)[0]) if encoded else None
+        typed = self._arrays[field] = (kind, array_values, present, codes)
+        return typed
+
+    def mask(self, predicate):
+        """
+        returns the numpy boolean array of the rows (row key - 1) a predicate selects
+        """
+        try:
+            return predicate.evaluate(self)
+        except ValueError as error:
+            print('error,', error)
+            return False
+
+    def query(self, predicate, return_fields=None):
+        """
+        input parameter:    predicate
+        description:        condition built from Field, for example
+                            (Field('amount') >= 500) & Field('status').isin(['open', 'void'])
+        optional input:     return_fields
+        description:        use if only specific fields are wanted to be returned.
+                            defaults to returning all fields.
+
+        evaluates the condition as numpy masks over typed columns (see column_type) and
+        returns the matching rows in the layout get_by_field uses, in row order.
+        missing values never match a comparison; use Field(...).isnull() for them.
+        """
+
+        if np is None:
+            print('error, query needs numpy')
+            return False
+        if return_fields is None:
+            return_fields = self.headers
+        mask = self.mask(predicate)
+        if mask is False:
+            return False
+        keys = (np.flatnonzero(mask) + 1).tolist()
+        columns = [self.data[header].take(keys) for header in return_fields]
+        return [list(row) for row in zip(*columns)] if columns else [[] for _ in keys]
+
+    def join(self, other, on, other_on=None, how='inner', cast=None, suffix='_right'):
+        """
+        input parameter:    other
+        description:        ObjectifyTable (or ObjectifyXL / ObjectifyCSV) to join with
+        input parameter:    on
+        description:        key field of this table
+        optional input:     other_on
+        description:        key field of other. defaults to on.
+        optional input:     how
+        description:        'inner' keeps rows with a match, 'left' keeps every row of this
+                            table and fills other's fields with None where there is no match.
+        optional input:     cast
+        description:        function applied to both keys before matching, e.g. str to
+                            match a number read from xlsx against the same text in a csv.
+        optional input:     suffix
+        description:        added to other's field names that this table already has.
+
+        hash join: other's keys go into a dictionary once (or its index from create_index
+        is used), then each row of this table is looked up in it. returns a new
+        ObjectifyTable with this table's fields followed by other's, without other's key
+        field, one row per matching pair in this table's row order.
+        """
+
+        other_on = other_on or on
+        if on not in self.data or other_on not in other.data:
+            print('error, join field missing', on if on not in self.data else other_on)
+            return False
+        if how not in ('inner', 'left'):
+            print('error, unknown join', how, "expected 'inner' or 'left'")
+            return False
+
+        if cast is None and other_on in other._indexes:
+            postings = other._indexes[other_on]
+        else:
+            postings = {}
+            for key, value in other.data[other_on].items():
+                postings.setdefault(value if cast is None else cast(value), []).append(key)
+
+        left_keys = []
+        right_keys = []
+        for key, value in self.data[on].items():
+            matches = postings.get(value if cast is None else cast(value))
+            if matches:
+                left_keys.extend([key] * len(matches))
+                right_keys.extend(matches)
+            elif how == 'left':
+                left_keys.append(key)
+                right_keys.append(0)
+
+        right_fields = [field for field in other.headers if field != other_on]
+        headers = self.headers + [field + suffix if field in self._positions else field
+                                  for field in right_fields]
+        table = ObjectifyTable(headers)
+        columns = [self.data[field].take(left_keys) for field in self.headers]
+        if how == 'left' and 0 in right_keys:
+            # row 0 stands for no match
+            found = [key for key in right_keys if key]
+            for field in right_fields:
+                values = iter(other.data[field].take(found))
+                columns.append([next(values) if key else None for key in right_keys])
+        else:
+            columns.extend(other.data[field].take(right_keys) for field in right_fields)
+        for header, values in zip(headers, columns):
+            table.data[header].extend(values)
+        table.total_entries = len(left_keys)
+        return table
+
+    def group_by(self, by, aggregates=None):
+        """
+        input parameter:    by
+        description:        field, or list of fields, whose values make up a group
+        optional input:     aggregates
+        description:        dictionary of field: list of operations out of count, sum,
+                            min, max and mean, e.g. {'amount': ['sum', 'mean']}.
+                            count counts the values present ('' and None are not),
+                            sum and mean use the values that parse as numbers.
+
+        returns a new ObjectifyTable with one row per group (see GroupBy.table)
+        """
+
+        grouping = GroupBy(by, aggregates)
+        if not grouping.check(self.data):
+            return False
+        grouping.add({field: self.data[field].values_list()
+                      for field in grouping.by + grouping.fields})
+        return grouping.table()
+
+    def __cache_state__(self):
+        """
+        what TableCache stores for this table
+        """
+        return {'headers': self.headers, 'positions': self._positions, 'data': self.data,
+                'total_entries': self.total_entries}
+
+    def __restore__(self, state):
+        self.headers = state['headers']
+        self._positions = state['positions']
+        self.data = state['data']
+        self.total_entries = state['total_entries']
+
+
+class TableCache(object):
+    """
+    directory of parsed tables, one pickle per source file fingerprint (path, size,
+    mtime and the load options), so an unchanged file is never parsed twice. changing
+    the source changes its fingerprint; the stale entry ages out of the directory,
+    which is held under max_bytes by dropping the least recently used entries.
+    only point it at a directory you trust, entries are unpickled.
+    """
+
+    def __init__(self, directory, max_bytes=1 << 30):
+        """
+        input parameter:    directory
+        description:        where the entries are kept, created when missing
+        optional input:     max_bytes
+        description:        size bound of the directory
+        """
+
+        self.directory = directory
+        self.max_bytes = max_bytes
+        os.makedirs(directory, exist_ok=True)
+
+    def key(self, path, *options):
+        """
+        returns the entry name for a source file and the options it was loaded with
+        """
+        status = os.stat(path)
+        fingerprint = repr((os.path.abspath(path), status.st_size, status.st_mtime_ns) + options)
+        return hashlib.sha1(fingerprint.encode('utf-8')).hexdigest()
+
+    def get(self, key):
+        """
+        returns the stored state, or None when there is no usable entry
+        """
+        entry = os.path.join(self.directory, key + '.pickle')
+        try:
+            with open(entry, 'rb') as file:
+                state = pickle.load(file)
+        except FileNotFoundError:
+            return None
+        except (OSError, EOFError, pickle.UnpicklingError):
+            # a damaged entry is dropped and parsed again
+            self.__remove__(entry)
+            return None
+        # the modification time doubles as the last use for eviction
+        os.utime(entry)
+        return state
+
+    def put(self, key, state):
+        entry = os.path.join(self.directory, key + '.pickle')
+        partial = '%s.%d.tmp' % (entry, os.getpid())
+        with open(partial, 'wb') as file:
+            pickle.dump(state, file, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(partial, entry)
+        self.evict()
+
+    def evict(self):
+        """
+        removes the least recently used entries until the directory fits in max_bytes
+        """
+        entries = []
+        for name in os.listdir(self.directory):
+            if name.endswith('.pickle'):
+                try:
+                    status = os.stat(os.path.join(self.directory, name))
+                except FileNotFoundError:
+                    continue
+                entries.append((status.st_mtime_ns, status.st_size, name))
+        total = sum(size for _, size, _ in entries)
+        for _, size, name in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            self.__remove__(os.path.join(self.directory, name))
+            total -= size
+
+    @staticmethod
+    def __remove__(entry):
+        try:
+            os.remove(entry)
+        except FileNotFoundError:
+            pass
 
-class ObjectifyXL(object):
+
+class ObjectifyXL(ObjectifyTable):
     """
     object for parsing table in an excel file
     """
 
-    def __init__(self, path, head_row=1, sheet=''):
+    def __init__(self, path, head_row=1, sheet='', read_only=True, fields=None, lazy=False,
+                 cache_dir=None, cache_size=1 << 30):
         """
         input parameter:    path
         description:        relative path from the python file running to the target xlsx file
@@ -17,17 +1011,138 @@ class ObjectifyXL(object):
         input parameter:    sheet
         description:        name of the sheet with the table
                             defaults to the active sheet when the file is opened
+        optional input:     read_only
+        description:        stream the sheet with openpyxl's read only, values only row
+                            iteration. defaults to True; False loads the workbook in
+                            edit mode and reads cell by cell (same results, much slower).
+        optional input:     fields
+        description:        only these fields are loaded into data and headers.
+                            defaults to every field.
+        optional input:     lazy
+        description:        defer reading the sheet until data, headers or total_entries
+                            is first used.
+        optional input:     cache_dir, cache_size
+        description:        keep the parsed sheet in a TableCache in this directory, bounded
+                            to cache_size bytes. an unchanged file then loads from the cache.
         """
 
-        self.data = {}
-        self.headers = []
-        self.total_entries = 0
+        ObjectifyTable.__init__(self)
         self.path = path
         self.offset = head_row
+        self.sheet = sheet
+        self.read_only = read_only
+        self.fields = fields
+        self.cache = TableCache(cache_dir, cache_size) if cache_dir else None
+        self._columns = {}
+        self._loaded = False
+        if not lazy:
+            self.load()
+
+    @property
+    def data(self):
+        if not self._loaded:
+            self.load()
+        return self._data
+
+    @data.setter
+    def data(self, value):
+        self._data = value
+
+    @property
+    def headers(self):
+        if not self._loaded:
+            self.load()
+        return self._headers
+
+    @headers.setter
+    def headers(self, value):
+        self._headers = value
 
-        wb = openpyxl.load_workbook(self.path)
-        self.shape_data(wb, head_row, sheet)
+    @property
+    def total_entries(self):
+        if not self._loaded:
+            self.load()
+        return self._total_entries
+
+    @total_entries.setter
+    def total_entries(self, value):
+        self._total_entries = value
+
+    def load(self):
+        """
+        reads the sheet into data, unless that already happened
+        """
+
+        if self._loaded:
+            return
+        self._loaded = True
+        if self.cache is not None:
+            key = self.cache.key(self.path, 'xl', self.sheet, self.offset,
+                                 None if self.fields is None else tuple(self.fields))
+            state = self.cache.get(key)
+            if state is not None:
+                self.__restore__(state)
+                return
+        wb = openpyxl.load_workbook(self.path, read_only=self.read_only)
+        if self.read_only:
+            self.stream_data(wb, self.offset, self.sheet)
+        else:
+            self.shape_data(wb, self.offset, self.sheet)
         wb.close()
+        if self.cache is not None:
+            self.cache.put(key, self.__cache_state__())
+
+    def __cache_state__(self):
+        state = ObjectifyTable.__cache_state__(self)
+        state['columns'] = self._columns
+        return state
+
+    def __restore__(self, state):
+        ObjectifyTable.__restore__(self, state)
+        self._columns = state['columns']
+
+    def __add_titles__(self, titles):
+        """
+        records where every title sits in the sheet and adds the wanted ones as fields.
+        returns the sheet positions (0 based) of the loaded fields, in header order.
+        """
+
+        for col_counter, title in enumerate(titles, 1):
+            self._columns[title] = col_counter
+            if self.fields is None or title in self.fields:
+                self.add_field(title)
+        return [self._columns[title] - 1 for title in self._positions]
+
+    def stream_data(self, wb, head_row, sheet):
+        """
+        take a read only workbook and optionally sheet name
+        populate the data dictionary with contents of the workbook sheet, one pass over
+        its rows, materializing only the loaded fields
+        """
+
+        if sheet == '':
+            ws = wb.active
+        else:
+            ws = wb[sheet]
+
+        titles = []
+        for title in next(ws.iter_rows(min_row=head_row, max_row=head_row, values_only=True), ()):
+            if title is None:
+                break
+            titles.append(title)
+        positions = self.__add_titles__(titles)
+        if not titles:
+            # nothing to load, but count the rows the way shape_data does
+            self.total_entries = (ws.max_row or head_row) - head_row
+            return
+
+        rows = ws.iter_rows(min_row=head_row+1, max_col=len(titles), values_only=True)
+        while True:
+            chunk = list(islice(rows, 4096))
+            if not chunk:
+                break
+            self.extend_rows([[row[position] if position < len(row) else None
+                               for position in positions] for row in chunk])
 
     def shape_data(self, wb, head_row, sheet):
         """
@@ -35,60 +1150,25 @@ class ObjectifyXL(object):
         populate the data dictionary with contents of the workbook sheet
         """
 
-        row_counter = 0
         col_counter = 1
 
         if sheet == '':
             ws = wb.active
         else:
-            ws = wb.get_sheet_by_name(sheet)
+            ws = wb[sheet]
 
         max_rows = ws.max_row
-        self.total_entries = max_rows - head_row
 
+        titles = []
         while ws.cell(row=head_row, column=col_counter).value is not None:
-            title = ws.cell(row=head_row, column=col_counter).value
-            self.headers.append(title)
-            self.data[title] = {}
+            titles.append(ws.cell(row=head_row, column=col_counter).value)
             col_counter += 1
+        positions = self.__add_titles__(titles)
 
         for row in range(head_row+1, max_rows+1):
-            row_counter += 1
-            col_counter = 1
-            for title in self.headers:
-                entry = ws.cell(row=row, column=col_counter).value
-                self.data[title][row_counter] = entry
-                col_counter += 1
-
-    def get_by_field(self, filt, return_fields=None):
-        """
-        input parameter:    filter
-        description:        dictionary that matches field names to a value that we filter by
-        optional input:     return_fields
-        description:        use if only specific fields are wanted to be returned.
-                            defaults to returning all fields.
-        """
-
-        if return_fields is None:
-            return_fields = self.headers
-
-        results = []
-        keys = set()
-
-        # search for any key that matches a filter and add it to the keys set
-        for header, sets in self.data.items():
-            for key, value in sets.items():
-                if header in filt:
-                    if filt[header] == value:
-                        keys.add(key)
-
-        for key in keys:
-            row = []
-            for header in return_fields:
-                row.append(self.data[header][key])
-            results.append(row)
-
-        return results
+            self.append_row([ws.cell(row=row, column=position + 1).value
+                             for position in positions])
+        self.total_entries = max_rows - head_row
 
     def write_to_file(self, in_dict, sheet_name=None, keys=None):
         """
@@ -97,105 +1177,396 @@ class ObjectifyXL(object):
                             corresponding values are what will populate a new line
                             option to input multiple fields with one call by populating
                             dictionary with a list.
+        optional input:     sheet_name
+        description:        sheet to write to. defaults to the sheet the table was loaded from.
+        optional input:     keys
+        description:        rows to overwrite, one per value. without keys the values are
+                            appended after the last row.
         assumption:         if provided key does not match a field, it will be ignored.
+
+        loads and saves the workbook on every call, use batch() for many edits.
         """
 
-        file = openpyxl.load_workbook(self.path, read_only=False)
+        with self.batch(sheet_name) as session:
+            session.write_to_file(in_dict, keys)
+        return True
 
-        if sheet_name:
-            table = file['Sheet1']
-        else:
-            table = file.active
+    def batch(self, sheet_name=None):
+        """
+        returns an XLBatchWriter that collects write_to_file edits and saves them
+        with one workbook load and save, for use as
+            with table.batch() as session:
+                session.write_to_file({...})
+        """
+        return XLBatchWriter(self, sheet_name)
+
+    def __write_cells__(self, table, in_dict, keys, start_key):
+        """
+        writes one write_to_file edit into an open worksheet. appends start at start_key.
+        returns the number of rows appended.
+        """
 
         if not keys:
             # add to end of data file
-            start_key = len(self.data[self.headers[0]]) + 1
             for header, data_list in in_dict.items():
                 entry_row = start_key + self.offset
-                entry_col = self.headers.index(header) + 1
+                entry_col = self._columns[header]
                 for value in data_list:
                     table.cell(row=entry_row, column=entry_col).value = value
                     entry_row += 1
+            return max([len(data_list) for data_list in in_dict.values()] or [0])
+
+        # keys provided, overwrite existing data fields
+        for header, data_list in in_dict.items():
+            entry_col = self._columns[header]
+            for index, value in enumerate(data_list):
+                entry_row = keys[index] + self.offset
+                table.cell(row=entry_row, column=entry_col).value = value
+        return 0
+
+    def __mirror__(self, in_dict, keys):
+        """
+        repeats a written edit in memory so data and indexes match the file
+        """
+
+        if not keys:
+            entries = max([len(data_list) for data_list in in_dict.values()] or [0])
+            self.extend_rows([[in_dict[header][index]
+                               if header in in_dict and index < len(in_dict[header]) else None
+                               for header in self.headers] for index in range(entries)])
         else:
-            # keys provided, overwrite existing data fields
             for header, data_list in in_dict.items():
-                entry_col = self.headers.index(header) + 1
-                for index, value in enumerate(data_list):
-                    entry_row = keys[index] + self.offset
-                    table.cell(row=entry_row, column=entry_col).value = value
+                if header in self.data:
+                    for index, value in enumerate(data_list):
+                        self.set_value(header, keys[index], value)
 
-        file.save(self.path)
+
+class XLBatchWriter(object):
+    """
+    collects appends and keyed overwrites for an ObjectifyXL and applies them all with
+    one load and one save of the workbook, then updates the table's data, total_entries
+    and indexes to match
+    """
+
+    def __init__(self, table, sheet_name=None):
+        """
+        input parameter:    table
+        data type:          ObjectifyXL
+        description:        table whose workbook receives the edits
+        optional input:     sheet_name
+        description:        sheet to write to. defaults to the sheet the table was loaded from.
+        """
+
+        self.table = table
+        self.sheet_name = sheet_name or table.sheet
+        self._edits = []
+
+    def write_to_file(self, in_dict, keys=None):
+        """
+        queues an edit, takes the same in_dict and keys as ObjectifyXL.write_to_file.
+        edits are applied in the order they were queued.
+        """
+        # a lazy table has no columns to match the fields against until it loads
+        self.table.load()
+        in_dict = {header: list(data_list) for header, data_list in in_dict.items()
+                   if header in self.table._columns}
+        self._edits.append((in_dict, list(keys) if keys else None))
+        return True
+
+    def save(self):
+        """
+        writes the queued edits out and mirrors them in memory
+        """
+
+        if not self._edits:
+            return True
+        file = openpyxl.load_workbook(self.table.path, read_only=False)
+        if self.sheet_name:
+            sheet = file[self.sheet_name]
+        else:
+            sheet = file.active
+
+        start_key = self.table.total_entries + 1
+        for in_dict, keys in self._edits:
+            start_key += self.table.__write_cells__(sheet, in_dict, keys, start_key)
+
+        file.save(self.table.path)
         file.close()
+
+        for in_dict, keys in self._edits:
+            self.table.__mirror__(in_dict, keys)
+        self._edits = []
         return True
 
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        # an exception in the with block drops the queued edits rather than saving half of them
+        if exc_type is None:
+            self.save()
+        else:
+            self._edits = []
+
 
-class ObjectifyCSV(object):
+class ObjectifyCSV(ObjectifyTable):
     """
     object for parsing a csv file
     """
 
-    def __init__(self, path):
+    def __init__(self, path, cache_dir=None, cache_size=1 << 30, encoding=None):
         """
         input parameter:    path
         description:        relative path from the python file running to the target csv file
+        optional input:     cache_dir, cache_size
+        description:        keep the parsed file in a TableCache in this directory, bounded
+                            to cache_size bytes. an unchanged file then loads from the cache.
+        optional input:     encoding
+        description:        encoding of the file. defaults to the one open() uses.
         """
 
-        self.data = {}
-        self.headers = []
-        self.total_entries = 0
+        ObjectifyTable.__init__(self)
         self.path = path
-        self.file_str = ''
+        self.encoding = encoding or locale.getpreferredencoding(False)
+        self.cache = TableCache(cache_dir, cache_size) if cache_dir else None
+        self.__reset_read__()
 
-        with open(path, 'r') as csv_file:
-            self.file_str = csv_file.read()
-        csv_file.close()
+        if self.cache is not None:
+            key = self.cache.key(path, 'csv', self.encoding)
+            state = self.cache.get(key)
+            if state is not None:
+                self.__restore__(state)
+                return
 
-        with open(path) as csv_file:
-            csv_reader = csv.reader(csv_file, delimiter=',')
-            line_count = 0
-            for row in csv_reader:
-                if line_count == 0:
-                    for header in row:
-                        self.data[header] = {}
-                        self.headers.append(header)
-                else:
-                    self.total_entries += 1
-                    col_count = 0
-                    for entry in row:
-                        header = self.headers[col_count]
-                        self.data[header][line_count] = entry
-                        col_count += 1
-                line_count += 1
+        self.__read__()
 
-    def get_by_field(self, filter, return_fields=None):
+        if self.cache is not None:
+            self.cache.put(key, self.__cache_state__())
+
+    def __reset_read__(self):
+        # bytes parsed so far that end in a line break, and the bytes of a last row
+        # without one; that row is parsed again by refresh once the file grows
+        self._offset = 0
+        self._pending = b''
+        self._pending_rows = []
+        self._inode = None
+        self._mtime = None
+        self._check = None
+
+    def __read__(self):
         """
-        input parameter:    filter
-        description:        dictionary that matches field names to a value that we filter by
-        optional input:     return_fields
+        parses the file from self._offset to its end, 1MB of whole records at a time
+        """
+
+        with open(self.path, 'rb') as file:
+            file.seek(self._offset)
+            replace = self._pending_rows
+            self._pending = b''
+            self._pending_rows = []
+            chunk = b''
+            while True:
+                # a record longer than a block is carried over whole, and the next read
+                # grows with it so the carried bytes are parsed a bounded number of times
+                block = file.read(max(1 << 20, 2 * len(chunk)))
+                chunk += block
+                ends = [0]
+                records = _csv_records(chunk, self.encoding, final=not block)
+                replace = self.__add_records__(self.__rows__(records, ends), replace)
+                if ends[0]:
+                    self._offset += ends[0]
+                    chunk = chunk[ends[0]:]
+                if not block:
+                    break
+            if chunk:
+                start = self.total_entries
+                replace = self.__add_records__(_csv_rows(chunk, self.encoding), replace)
+                self._pending = chunk
+                self._pending_rows = list(range(start + 1, self.total_entries + 1))
+            status = os.fstat(file.fileno())
+            self._inode = status.st_ino
+            self._mtime = status.st_mtime_ns
+        self._check = _fingerprint(self.path, self._offset)
+
+    @staticmethod
+    def __rows__(records, ends):
+        """
+        the rows of _csv_records, keeping the end of the last one in ends[0]
+        """
+        for end, row in records:
+            ends[0] = end
+            yield row
+
+    def __add_records__(self, rows, replace):
+        """
+        adds parsed records as rows: the first record of the file is the headers, and
+        the first rows fill in the row numbers in replace (the rows of a last line
+        re-read with its continuation). returns the row numbers left to replace.
+        """
+
+        rows = iter(rows)
+        if self._offset == 0 and not self.headers:
+            for header in next(rows, []):
+                self.add_field(header)
+        replaced = 0
+        for number, row in zip(replace, rows):
+            for header, position in self._positions.items():
+                self.set_value(header, number, row[position] if position < len(row) else None)
+            replaced += 1
+        while True:
+            batch = list(islice(rows, 4096))
+            if not batch:
+                break
+            self.extend_rows(batch)
+        return replace[replaced:]
+
+    def refresh(self):
+        """
+        picks up rows appended to the file since it was read: only the new bytes are
+        parsed and data, total_entries, indexes and types are extended in place.
+        a file that was truncated, replaced or rewritten is loaded again in full.
+        returns the change in total_entries.
+        """
+
+        entries = self.total_entries
+        try:
+            status = os.stat(self.path)
+        except OSError:
+            print('error, cannot read', self.path)
+            return False
+        size = self._offset + len(self._pending)
+        if status.st_size == size and status.st_ino == self._inode and \
+                status.st_mtime_ns == self._mtime:
+            return 0
+        # the same size with a new modification time is a rewrite, not an append
+        if status.st_ino != self._inode or status.st_size <= size or \
+                self._offset == 0 or \
+                _fingerprint(self.path, self._offset) != self._check or \
+                not self.__pending_kept__():
+            self.reload()
+        else:
+            self.__read__()
+        return self.total_entries - entries
+
+    def __pending_kept__(self):
+        """
+        whether the last row without a line break is still there, only continued
+        """
+        if not self._pending:
+            return True
+        with open(self.path, 'rb') as file:
+            file.seek(self._offset)
+            return file.read(len(self._pending)) == self._pending
+
+    def reload(self):
+        """
+        loads the whole file again, keeping the indexes and types set on the table
+        """
+        indexed = list(self._indexes)
+        types = self._types
+        ObjectifyTable.__init__(self)
+        self._types = types
+        self.__reset_read__()
+        self.__read__()
+        for field in indexed:
+            self.create_index(field)
+
+    def __cache_state__(self):
+        state = ObjectifyTable.__cache_state__(self)
+        state['read'] = (self._offset, self._pending, self._pending_rows, self._inode,
+                         self._mtime, self._check)
+        return state
+
+    def __restore__(self, state):
+        ObjectifyTable.__restore__(self, state)
+        (self._offset, self._pending, self._pending_rows, self._inode, self._mtime,
+         self._check) = state['read']
+
+    def __written__(self, offset):
+        """
+        records that the file was written up to offset by this table's own writer,
+        whose rows are already in memory
+        """
+        self._offset = offset
+        self._pending = b''
+        self._pending_rows = []
+        self._mtime = os.stat(self.path).st_mtime_ns
+        self._check = _fingerprint(self.path, offset)
+
+    @staticmethod
+    def iter_rows(path, fields=None, filt=None):
+        """
+        input parameter:    path
+        description:        relative path from the python file running to the target csv file
+        optional input:     fields
         description:        use if only specific fields are wanted to be returned.
                             defaults to returning all fields.
+        optional input:     filt
+        description:        dictionary that matches field names to a value that we filter by,
+                            as in get_by_field: a row is kept when any of the fields matches.
+                            defaults to keeping every row.
+
+        yields each row as a list straight from the csv reader, so memory use does not
+        grow with the size of the file.
         """
 
-        if return_fields is None:
-            return_fields = self.headers
+        with open(path, newline='') as csv_file:
+            csv_reader = csv.reader(csv_file, delimiter=',')
+            headers = next(csv_reader, [])
+            if fields is None:
+                fields = headers
+            positions = [headers.index(field) for field in fields]
+            checks = []
+            if filt is not None:
+                checks = [(headers.index(field), value) for field, value in filt.items()
+                          if field in headers]
+            for row in csv_reader:
+                if filt is not None:
+                    for position, value in checks:
+                        if position < len(row) and row[position] == value:
+                            break
+                    else:
+                        continue
+                yield [row[position] if position < len(row) else None for position in positions]
+
+    @staticmethod
+    def group_by_path(path, by, aggregates=None, chunk_size=4096):
+        """
+        group_by straight from a csv file, chunk_size rows at a time through iter_rows,
+        so memory use grows with the number of groups rather than the size of the file
+        """
 
-        results = []
-        keys = set()
+        grouping = GroupBy(by, aggregates)
+        with open(path, newline='') as csv_file:
+            headers = next(csv.reader(csv_file), [])
+        if not grouping.check(headers):
+            return False
+        fields = grouping.by + grouping.fields
+        rows = ObjectifyCSV.iter_rows(path, fields)
+        while True:
+            chunk = list(islice(rows, chunk_size))
+            if not chunk:
+                break
+            grouping.add(dict(zip(fields, zip(*chunk))))
+        return grouping.table()
 
-        # search for any key that matches a filter and add it to the keys set
-        for header, sets in self.data.items():
-            for key, value in sets.items():
-                if header in filter:
-                    if filter[header] == value:
-                        keys.add(key)
+    @staticmethod
+    def row_index(path, key=None, index_path=None, encoding=None):
+        """
+        returns a CSVRowIndex of the file, for reading single rows (by row number or by
+        the value of the key field) without loading the file
+        """
+        return CSVRowIndex(path, key, index_path, encoding)
 
-        for key in keys:
-            row = []
-            for header in return_fields:
-                row.append(self.data[header][key])
-            results.append(row)
+    def get_by_field(self, filter, return_fields=None, mode='or'):
+        """
+        input parameter:    filter
+        description:        dictionary that matches field names to a value that we filter by
+        optional input:     return_fields, mode
+        description:        as in ObjectifyTable.get_by_field
 
-        return results
+        kept under its old parameter name, callers pass filter= by keyword
+        """
+        return ObjectifyTable.get_by_field(self, filter, return_fields, mode)
 
     def write_to_file(self, in_dict):
         """
@@ -205,15 +1576,29 @@ class ObjectifyCSV(object):
                             option to input multiple fields with one call by populating
                             dictionary with a list.
         assumption:         if provided key does not match a field, it will be ignored.
+
+        the rows are appended to the end of the file, so the cost does not grow with the
+        size of the file and rows added since the object was loaded are kept.
+        """
+
+        with self.writer() as writer:
+            return writer.add(in_dict)
+
+    def writer(self, batch_size=1000):
         """
+        optional input:     batch_size
+        description:        rows buffered before they are written out.
 
-        def arr_to_entry(in_arr):
-            result = ''
-            for value in in_arr:
-                if value:
-                    result += value
-                result += ','
-            return result[:-1] + '\n'
+        returns a CSVBatchWriter that appends rows to the file. use it as a context
+        manager for loops of many small writes.
+        """
+        return CSVBatchWriter(self, batch_size)
+
+    def rows_from_dict(self, in_dict):
+        """
+        turns a write_to_file dictionary into rows in header order.
+        returns False when single values and lists are mixed.
+        """
 
         multiple_fields = None
         entries = 1
@@ -232,9 +1617,7 @@ class ObjectifyCSV(object):
             else:
                 multiple_fields = False
 
-        file = open(self.path, 'w')
-        file.write(self.file_str)
-
+        rows = []
         if multiple_fields:
             for index in range(entries):
                 entry = []
@@ -243,7 +1626,7 @@ class ObjectifyCSV(object):
                         entry.append(in_dict[field][index])
                     else:
                         entry.append(None)
-                file.write(arr_to_entry(entry))
+                rows.append(entry)
         else:
             entry = []
             for field in self.headers:
@@ -251,11 +1634,457 @@ class ObjectifyCSV(object):
                     entry.append(in_dict[field])
                 else:
                     entry.append(None)
-            file.write(arr_to_entry(entry))
+            rows.append(entry)
+        return rows
 
-        file.close()
+
+class CSVBatchWriter(object):
+    """
+    appends rows to the file of an ObjectifyCSV through one append mode handle,
+    writing them out every batch_size rows and keeping the table's data,
+    total_entries and indexes updated in place as rows are written
+    """
+
+    def __init__(self, table, batch_size=1000):
+        """
+        input parameter:    table
+        data type:          ObjectifyCSV
+        description:        table whose file receives the rows
+        optional input:     batch_size
+        description:        rows buffered before they are written out
+        """
+
+        self.table = table
+        self.batch_size = batch_size
+        self._buffer = []
+        # rows other writers appended come first, so row numbers match the file
+        table.refresh()
+        # never glue the first new row onto a last line without a line break
+        with open(table.path, 'rb') as check:
+            check.seek(0, 2)
+            unterminated = check.tell() > 0
+            if unterminated:
+                check.seek(-1, 2)
+                unterminated = check.read(1) not in (b'\n', b'\r')
+        self._file = open(table.path, 'a', newline='', encoding=table.encoding)
+        if unterminated:
+            self._file.write('\n')
+        self._writer = csv.writer(self._file, lineterminator='\n')
+
+    def add(self, in_dict):
+        """
+        buffers the rows of a write_to_file style dictionary
+        """
+        rows = self.table.rows_from_dict(in_dict)
+        if rows is False:
+            return False
+        for row in rows:
+            self.add_row(row)
+        return True
+
+    def add_row(self, row):
+        """
+        buffers one row given as a list in header order
+        """
+        self._buffer.append(['' if value is None else value for value in row])
+        if len(self._buffer) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        if not self._buffer:
+            return
+        self._writer.writerows(self._buffer)
+        self._file.flush()
+        # mirror the rows in memory as they will read back
+        self.table.extend_rows([[str(value) for value in row] for row in self._buffer])
+        self.table.__written__(self._file.tell())
+        self._buffer = []
+
+    def close(self):
+        if self._file is not None:
+            self.flush()
+            self._file.close()
+            self._file = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+def _fingerprint(path, offset):
+    """
+    crc32 of the start of a file and of the bytes before offset, enough to tell a file
+    that was only appended to past offset from one that was rewritten
+    """
+    with open(path, 'rb') as file:
+        # never past offset, or appending to a short file would look like a rewrite
+        head = file.read(min(64, offset))
+        file.seek(max(0, offset - 64))
+        tail = file.read(offset - max(0, offset - 64))
+    return zlib.crc32(head), zlib.crc32(tail)
+
+
+def _csv_records(chunk, encoding, final=False, parse=True):
+    """
+    input parameter:    chunk
+    description:        bytes of a csv file, starting at the start of a record
+    optional input:     final
+    description:        chunk runs to the end of the file, so a last line break can not
+                        be the first half of a '\r\n' still to be read
+    optional input:     parse
+    description:        when False and chunk holds no quotes, rows are not parsed and
+                        None is yielded in their place
+
+    yields (end, row) for each complete record at the start of chunk: one the csv module
+    parses as ending in a line break, so a " inside an unquoted field (5" screen) is just
+    a character. end is the byte offset just past the record. the bytes after the last
+    end (a line without its line break, or a record still inside quotes) are not yielded.
+    """
+
+    lines = chunk.splitlines(True)
+    if lines and (not lines[-1].endswith((b'\n', b'\r')) or
+                  (not final and lines[-1].endswith(b'\r'))):
+        lines.pop()
+    if not parse and b'"' not in chunk:
+        end = 0
+        for line in lines:
+            end += len(line)
+            yield end, None
+        return
+
+    total = sum(map(len, lines))
+    position = 0
+
+    def feed():
+        nonlocal position
+        for line in lines:
+            position += len(line)
+            text = line.decode(encoding)
+            if '\r' in text:
+                # the line ending translation open() does in text mode
+                text = text.replace('\r\n', '\n').replace('\r', '\n')
+            yield text
+        # past the end: a record that swallows this line was still inside quotes
+        position += 1
+        yield '\n'
+
+    # the reader takes a line only when the record so far needs another, so position
+    # is the end of the record it has just returned
+    for row in csv.reader(feed(), delimiter=','):
+        if position > total:
+            return
+        yield position, row
+
+
+def _csv_rows(records, encoding):
+    """
+    parses bytes holding whole or partial csv records into rows
+    """
+    text = records.decode(encoding)
+    if '\r' in text:
+        text = text.replace('\r\n', '\n').replace('\r', '\n')
+    return list(csv.reader(io.StringIO(text), delimiter=','))
+
+
+class CSVRowIndex(object):
+    """
+    byte offset of every row of a csv file, kept in a sidecar file next to it, so rows
+    can be read by number (1 for the first row under the headers, as in ObjectifyCSV)
+    or by a key field without parsing the rest of the file. the file is read through
+    mmap and only the requested rows are parsed. rows appended to the file are indexed
+    incrementally by refresh(); a truncated or rewritten file is indexed again.
+    """
+
+    version = 1
+
+    def __init__(self, path, key=None, index_path=None, encoding=None):
+        """
+        input parameter:    path
+        description:        relative path from the python file running to the target csv file
+        optional input:     key
+        description:        field whose values find() looks rows up by
+        optional input:     index_path
+        description:        sidecar file. defaults to the csv path plus '.idx'
+        optional input:     encoding
+        description:        encoding of the csv file. defaults to the one open() uses,
+                            as in ObjectifyCSV.
+        """
+
+        self.path = path
+        self.key = key
+        self.index_path = index_path or path + '.idx'
+        self.encoding = encoding or locale.getpreferredencoding(False)
+        self._map = None
+        self.__reset__()
+        self.__read_sidecar__()
+        self.refresh()
+
+    def __reset__(self):
+        self.headers = []
+        self.keys = None if self.key is None else {}
+        self._key_position = None
+        self._offsets = array('Q')
+        # rows before _complete end in a line break; a last row without one is rescanned
+        # when the file grows, since a writer may still be in the middle of it
+        self._complete = 0
+        self._complete_rows = 0
+        self._end = 0
+        self._inode = None
+        self._check = None
+
+    def __read_sidecar__(self):
+        try:
+            with open(self.index_path, 'rb') as file:
+                state = pickle.load(file)
+        except (OSError, EOFError, pickle.UnpicklingError):
+            return False
+        if state.get('version') != self.version or state.get('key') != self.key or \
+                state.get('encoding') != self.encoding:
+            return False
+        for name in ('headers', 'keys', 'offsets', 'complete', 'complete_rows', 'end',
+                     'inode', 'check'):
+            setattr(self, name if name in ('headers', 'keys') else '_' + name, state[name])
+        if self.key is not None:
+            self._key_position = self.headers.index(self.key)
         return True
 
+    def __write_sidecar__(self):
+        state = {'version': self.version, 'key': self.key, 'encoding': self.encoding,
+                 'headers': self.headers, 'keys': self.keys, 'offsets': self._offsets,
+                 'complete': self._complete, 'complete_rows': self._complete_rows,
+                 'end': self._end, 'inode': self._inode, 'check': self._check}
+        partial = '%s.%d.tmp' % (self.index_path, os.getpid())
+        with open(partial, 'wb') as file:
+            pickle.dump(state, file, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(partial, self.index_path)
+
+    def refresh(self):
+        """
+        brings the index up to date with the file: indexes appended rows, or the whole
+        file again when it was truncated or rewritten. returns the number of rows added.
+        """
+
+        status = os.stat(self.path)
+        rows = len(self._offsets)
+        if self._check is None or status.st_ino != self._inode or \
+                status.st_size < self._complete or \
+                _fingerprint(self.path, self._complete) != self._check:
+            self.__reset__()
+            rows = 0
+            self.__scan__(0)
+        elif status.st_size != self._end:
+            self.__scan__(self._complete)
+        else:
+            self.__remap__()
+            return 0
+        self._inode = status.st_ino
+        self._check = _fingerprint(self.path, self._complete)
+        self.__write_sidecar__()
+        self.__remap__()
+        return len(self._offsets) - rows
+
+    def __scan__(self, start):
+        """
+        one sequential pass from start, splitting rows where ObjectifyCSV does (see
+        _csv_records) so row numbers match. rows are only parsed for the headers and
+        the key field, or when the file has quotes that could hide a line break
+        """
+
+        # forget the unterminated last row, it is read again below
+        while len(self._offsets) > self._complete_rows:
+            row = len(self._offsets)
+            if self.keys is not None:
+                value = self.row(row)
+                value = value[self._key_position] if self._key_position < len(value) else None
+                self.keys[value].remove(row)
+                if not self.keys[value]:
+                    del self.keys[value]
+            self._offsets.pop()
+
+        with open(self.path, 'rb') as file:
+            file.seek(start)
+            chunk_start = start
+            chunk = b''
+            while True:
+                block = file.read(max(1 << 20, 2 * len(chunk)))
+                chunk += block
+                used = 0
+                for end, row in _csv_records(chunk, self.encoding, final=not block,
+                                             parse=chunk_start == 0 or self.keys is not None):
+                    self.__record__(chunk_start + used, row)
+                    used = end
+                chunk = chunk[used:]
+                chunk_start += used
+                if not block:
+                    break
+            self._complete = chunk_start
+            self._complete_rows = len(self._offsets)
+            if chunk:
+                self.__record__(chunk_start, self.__parse__(chunk))
+            self._end = chunk_start + len(chunk)
+
+    def __record__(self, start, row):
+        if start == 0:
+            self.headers = row
+            if self.key is not None:
+                if self.key not in self.headers:
+                    print('error, key field not in the headers', self.key)
+                    self.key = self.keys = None
+                else:
+                    self._key_position = self.headers.index(self.key)
+            return
+        self._offsets.append(start)
+        if self.keys is not None:
+            value = row[self._key_position] if self._key_position < len(row) else None
+            self.keys.setdefault(value, []).append(len(self._offsets))
+
+    def __parse__(self, record):
+        rows = _csv_rows(record, self.encoding)
+        return rows[0] if rows else []
+
+    def __remap__(self):
+        if self._map is not None:
+            self._map.close()
+            self._map = None
+        if self._end:
+            with open(self.path, 'rb') as file:
+                self._map = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def __len__(self):
+        return len(self._offsets)
+
+    def row(self, number, fields=None):
+        """
+        input parameter:    number
+        description:        row number, 1 for the first row under the headers
+        optional input:     fields
+        description:        use if only specific fields are wanted to be returned.
+                            defaults to the whole row as it is in the file.
+        """
+
+        if number < 1 or number > len(self._offsets):
+            print('error, no row', number, 'in', self.path)
+            return False
+        start = self._offsets[number - 1]
+        end = self._offsets[number] if number < len(self._offsets) else self._end
+        if self._map is None or end > len(self._map):
+            with open(self.path, 'rb') as file:
+                file.seek(start)
+                row = self.__parse__(file.read(end - start))
+        else:
+            row = self.__parse__(self._map[start:end])
+        if fields is None:
+            return row
+        positions = [self.headers.index(field) for field in fields]
+        return [row[position] if position < len(row) else None for position in positions]
+
+    def rows(self, numbers, fields=None):
+        """
+        returns the rows with the provided numbers, in order
+        """
+        return [self.row(number, fields) for number in numbers]
+
+    def find(self, value, fields=None):
+        """
+        returns the rows whose key field equals value, in the layout get_by_field uses
+        """
+        if self.keys is None:
+            print('error, index was built without a key field')
+            return False
+        return self.rows(self.keys.get(value, ()), fields)
+
+    def close(self):
+        if self._map is not None:
+            self._map.close()
+            self._map = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+def _load_file(job):
+    """
+    parses one file for load_many, in a worker process
+    """
+    path, head_row, sheet, cache_dir = job
+    if path.lower().endswith('.csv'):
+        table = ObjectifyCSV(path, cache_dir=cache_dir)
+    else:
+        table = ObjectifyXL(path, head_row, sheet, cache_dir=cache_dir)
+    return table.headers, [table.data[header] for header in table.headers], table.total_entries
+
+
+def load_many(source, workers=None, source_field='source_file', head_row=1, sheet='',
+              cache_dir=None):
+    """
+    input parameter:    source
+    description:        directory (every csv / xlsx file in it), glob pattern, or list of paths
+    optional input:     workers
+    description:        processes parsing files at the same time. defaults to one per core,
+                        1 parses in this process.
+    optional input:     source_field
+    description:        name of the added field holding the file each row came from
+    optional input:     head_row, sheet
+    description:        passed to ObjectifyXL for xlsx files
+    optional input:     cache_dir
+    description:        TableCache directory shared by every file
+
+    parses the files in a process pool and merges them, in sorted path order, into one
+    ObjectifyTable numbered 1..total_entries across all files.
+    returns False when a file's headers differ from the first file's.
+    """
+
+    if isinstance(source, str):
+        if os.path.isdir(source):
+            paths = [os.path.join(source, name) for name in os.listdir(source)
+                     if name.lower().endswith(('.csv', '.xlsx', '.xlsm'))]
+        else:
+            paths = glob.glob(source)
+    else:
+        paths = list(source)
+    paths.sort()
+    if not paths:
+        print('error, no files found', source)
+        return False
+
+    jobs = [(path, head_row, sheet, cache_dir) for path in paths]
+    workers = min(workers or os.cpu_count() or 1, len(paths))
+    if workers == 1:
+        pool = futures = None
+        results = map(_load_file, jobs)
+    else:
+        pool = ProcessPoolExecutor(max_workers=workers)
+        futures = [pool.submit(_load_file, job) for job in jobs]
+        results = (future.result() for future in futures)
+
+    table = None
+    try:
+        for path, (headers, columns, entries) in zip(paths, results):
+            if table is None:
+                if source_field in headers:
+                    print('error, source field already in the headers', source_field)
+                    return False
+                table = ObjectifyTable(headers + [source_field])
+            elif sorted(headers) != sorted(table.headers[:-1]):
+                print('error, headers of', path, 'do not match', paths[0])
+                return False
+            for header, column in zip(headers, columns):
+                table.data[header].extend(column)
+            table.data[source_field].extend([path] * entries)
+            table.total_entries += entries
+    finally:
+        if pool is not None:
+            # on a header mismatch, don't parse the files still queued
+            for future in futures:
+                future.cancel()
+            pool.shutdown()
+    return table
+
 
 if __name__ == "__main__":
 
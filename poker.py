@@ -1,5 +1,194 @@
 import random
 
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# card codes: rank * 4 + suit, ranks from '2' (0) up to 'a' (12)
+RANKS = '234567890jqka'
+SUITS = 'schd'
+HAND_CATEGORIES = ('high card', 'pair', 'two pair', 'three of a kind', 'straight', 'flush',
+                   'full house', 'four of a kind', 'straight flush')
+
+# what each card adds to a hand's running total: 5 ** rank in the low 32 bits (five
+# cards of one rank can't happen, so the sum is a base 5 count of every rank) and one
+# in its suit's nibble above that (a nibble reaches 5 only for a flush)
+_CARD_ADD = [(1 << (32 + 4 * (code & 3))) + 5 ** (code >> 2) for code in range(52)]
+_RANK_TABLE = None
+_FLUSH_TABLE = None
+_NUMPY_TABLES = None
+
+
+def card_code(card):
+    """
+    'as' -> 51, the integer the evaluator works on
+    """
+    return RANKS.index(card[0]) * 4 + SUITS.index(card[1])
+
+
+def card_name(code):
+    """
+    51 -> 'as'
+    """
+    return RANKS[code >> 2] + SUITS[code & 3]
+
+
+def card_names(cards):
+    """
+    [51, 0] -> ['as', '2s'], for showing cards
+    """
+    return [card_name(code) for code in cards]
+
+
+def rank_category(strength):
+    """
+    name of the category of a hand_rank strength, e.g. 'full house'
+    """
+    return HAND_CATEGORIES[strength >> 20]
+
+
+def _strength(category, ranks):
+    # category in the top bits, then up to five deciding ranks, a nibble each
+    value = category
+    for position in range(5):
+        value = (value << 4) | (ranks[position] if position < len(ranks) else 0)
+    return value
+
+
+def _straight(mask):
+    """
+    top rank of the best straight in a rank bit mask, or None
+    """
+    for top in range(12, 3, -1):
+        if mask >> (top - 4) & 31 == 31:
+            return top
+    # the wheel: a 2 3 4 5
+    if mask & 0b1000000001111 == 0b1000000001111:
+        return 3
+    return None
+
+
+def _multiset_strength(counts):
+    """
+    best hand out of a rank multiset (counts[rank]) when there is no flush
+    """
+
+    ranks = [rank for rank in range(12, -1, -1) if counts[rank]]
+    quads = [rank for rank in ranks if counts[rank] == 4]
+    trips = [rank for rank in ranks if counts[rank] == 3]
+    pairs = [rank for rank in ranks if counts[rank] == 2]
+    if quads:
+        return _strength(7, [quads[0]] + [rank for rank in ranks if rank != quads[0]][:1])
+    if trips and len(trips) + len(pairs) > 1:
+        return _strength(6, [trips[0], max(trips[1:] + pairs)])
+    top = _straight(sum(1 << rank for rank in ranks))
+    if top is not None:
+        return _strength(4, [top])
+    if trips:
+        return _strength(3, [trips[0]] + [rank for rank in ranks if rank != trips[0]][:2])
+    if len(pairs) > 1:
+        return _strength(2, pairs[:2] + [rank for rank in ranks if rank not in pairs[:2]][:1])
+    if pairs:
+        return _strength(1, pairs[:1] + [rank for rank in ranks if rank != pairs[0]][:3])
+    return _strength(0, ranks[:5])
+
+
+def _build_tables():
+    """
+    fills the lookup tables on first use: every rank multiset of up to 7 cards keyed by
+    its base 5 sum, and every 13 bit mask of ranks in one suit
+    """
+    global _RANK_TABLE, _FLUSH_TABLE
+
+    table = {}
+    counts = [0] * 13
+
+    def fill(rank, cards, key):
+        if rank == 13:
+            table[key] = _multiset_strength(counts)
+            return
+        for count in range(min(4, 7 - cards) + 1):
+            counts[rank] = count
+            fill(rank + 1, cards + count, key + count * 5 ** rank)
+        counts[rank] = 0
+
+    fill(0, 0, 0)
+
+    flush = [0] * 8192
+    for mask in range(8192):
+        if bin(mask).count('1') >= 5:
+            top = _straight(mask)
+            if top is not None:
+                flush[mask] = _strength(8, [top])
+            else:
+                flush[mask] = _strength(5, [rank for rank in range(12, -1, -1)
+                                            if mask >> rank & 1][:5])
+    _RANK_TABLE = table
+    _FLUSH_TABLE = flush
+
+
+def hand_rank(cards):
+    """
+    input parameter:    cards
+    data type:          list[integer]
+    description:        up to 7 card codes (see card_code), e.g. a player's hole cards
+                        plus the community cards
+
+    returns the strength of the best 5 card hand in cards as one integer: a stronger
+    hand always gets a larger number and equal hands get the same number. the category
+    is strength >> 20 (see rank_category).
+    """
+
+    if _RANK_TABLE is None:
+        _build_tables()
+    total = sum(map(_CARD_ADD.__getitem__, cards))
+    flush = ((total >> 32) + 0x3333) & 0x8888
+    if flush:
+        suit = (flush.bit_length() - 4) >> 2
+        mask = 0
+        for card in cards:
+            if card & 3 == suit:
+                mask |= 1 << (card >> 2)
+        return _FLUSH_TABLE[mask]
+    return _RANK_TABLE[total & 0xFFFFFFFF]
+
+
+def hand_ranks(hands):
+    """
+    input parameter:    hands
+    data type:          numpy array (or nested list) of integers, one row per hand
+    description:        card codes, every hand the same number of cards (up to 7)
+
+    hand_rank for many hands at once with numpy; returns an int64 array of strengths
+    """
+
+    global _NUMPY_TABLES
+    if np is None:
+        print('error, hand_ranks needs numpy')
+        return False
+    if _NUMPY_TABLES is None:
+        if _RANK_TABLE is None:
+            _build_tables()
+        keys = np.array(sorted(_RANK_TABLE), dtype=np.int64)
+        _NUMPY_TABLES = (np.array(_CARD_ADD, dtype=np.int64), keys,
+                         np.array([_RANK_TABLE[key] for key in keys.tolist()], dtype=np.int64),
+                         np.array(_FLUSH_TABLE, dtype=np.int64))
+    card_add, keys, strengths, flush_table = _NUMPY_TABLES
+
+    hands = np.asarray(hands, dtype=np.int64)
+    total = card_add[hands].sum(axis=1)
+    result = strengths[np.searchsorted(keys, total & 0xFFFFFFFF)]
+    flush = ((total >> 32) + 0x3333) & 0x8888
+    rows = np.flatnonzero(flush)
+    if len(rows):
+        suit = (flush[rows] >= 0x80).astype(np.int64) + (flush[rows] >= 0x800) + \
+            (flush[rows] >= 0x8000)
+        flush_hands = hands[rows]
+        bits = np.where((flush_hands & 3) == suit[:, None], 1 << (flush_hands >> 2), 0)
+        result[rows] = flush_table[np.bitwise_or.reduce(bits, axis=1)]
+    return result
+
 
 class PokerGame(object):
     """
@@ -13,22 +202,33 @@ class PokerGame(object):
         description:        object that represents a player in the game
         """
         self.players = players
-        self.deck = []
-        self.__make_deck()
-        self.player_count = len(players)
-
-    def __make_deck(self):
-        suits = ['s', 'c', 'h', 'd']
-        cards = ['a', 'k', 'q', 'j', '0', '9', '8', '7', '6', '5', '4', '3', '2']
-        for suit in suits:
-            for card in cards:
-                self.deck.append(card + suit)
+        # card codes (see card_names for display), made once and reused every hand.
+        # next_card points at the top of the deck; everything before it has been dealt
+        self.deck = list(range(52))
+        self.next_card = 0
         self.shuffle()
+        self.player_count = len(players)
 
     def shuffle(self):
         for player in self.players:
             player.fold()
-        random.shuffle(self.deck)
+        # the deck is shuffled as it is drawn, see draw
+        self.next_card = 0
+
+    def draw(self):
+        """
+        returns the top card of the deck. the top card is picked at random from the cards
+        not yet dealt (a Fisher-Yates shuffle a step at a time), so a hand only pays for
+        the cards it deals instead of reshuffling all 52
+        """
+        deck = self.deck
+        top = self.next_card
+        pick = top + int(random.random() * (52 - top))
+        card = deck[pick]
+        deck[pick] = deck[top]
+        deck[top] = card
+        self.next_card = top + 1
+        return card
 
     def seat_players(self):
         seat = 0
@@ -45,181 +245,15 @@ class PokerGame(object):
                 self.player_count -= 1
 
     def evaluate(self):
-        rankings = []
-        still_in = []
+        """
+        returns the players still in the hand grouped by the strength of their best hand,
+        strongest first, with tied players in the same group: the rankings Pot.divvy takes
+        """
+        groups = {}
         for player in self.players:
             if player.in_hand:
-                still_in.append(player)
-
-        cards = ['a', 'k', 'q', 'j', '0', '9', '8', '7', '6', '5', '4', '3', '2', 'a']
-
-        # straight flush check
-        for index in range(10):
-            c1 = cards[index]
-            c2 = cards[index + 1]
-            c3 = cards[index + 2]
-            c4 = cards[index + 3]
-            c5 = cards[index + 4]
-            match = []
-            for player in still_in:
-                this_hand = player.hand
-                suit = ''
-                for card in this_hand:
-                    if card[0] == c1:
-                        suit = card[1]
-                if suit != '':
-                    if c2 + suit in this_hand and \
-                       c3 + suit in this_hand and \
-                       c4 + suit in this_hand and \
-                       c5 + suit in this_hand:
-                        match.append(player)
-                        still_in.remove(player)
-            if match:
-                rankings.append(match)
-
-        # four of a kind check
-        for number in cards:
-            match = []
-            match_4 = []
-            for player in still_in:
-                score = 0
-                for card in player.hand:
-                    if card[0] == number:
-                        score += 1
-                if score == 4:
-                    match_4.append(player)
-                    still_in.remove(player)
-            if match_4:
-                for kicker in cards:
-                    match = []
-                    for player_4 in match_4:
-                        if kicker != number:
-                            for card in player_4.hand:
-                                if card[0] == kicker:
-                                    match.append(player_4)
-            if match:
-                rankings.append(match)
-
-        # full house check
-        for number in cards:
-            match = []
-            match_3 = []
-            for player in still_in:
-                score3 = 0
-                for card in player.hand:
-                    if card[0] == number:
-                        score3 += 1
-                if score3 == 3:
-                    match_3.append(player)
-            if match_3:
-                for kicker in cards:
-                    match = []
-                    for player_3 in match_3:
-                        score2 = 0
-                        if kicker != number:
-                            for card in player_3.hand:
-                                if card[0] == kicker:
-                                    score2 += 1
-                            if score2 >= 2:
-                                print('full house', player_3)
-                                match.append(player_3)
-                                still_in.remove(player_3)
-                    if match:
-                        rankings.append(match)
-
-        # flush check
-        for number in cards:
-            match = []
-            for player in still_in:
-                for card in player.hand:
-                    if card[0] == number:
-                        suit = card[1]
-                        suit_count = 0
-                        for check_suits in player.hand:
-                            if check_suits[1] == suit:
-                                suit_count += 1
-                        if suit_count >= 5:
-                            print('flush', player)
-                            match.append(player)
-                            still_in.remove(player)
-            if match:
-                rankings.append(match)
-
-        # straight check
-        for index in range(10):
-            match = []
-            for player in still_in:
-                c1 = cards[index]
-                c1_check = False
-                c2 = cards[index + 1]
-                c2_check = False
-                c3 = cards[index + 2]
-                c3_check = False
-                c4 = cards[index + 3]
-                c4_check = False
-                c5 = cards[index + 4]
-                c5_check = False
-                this_hand = player.hand
-                for card in this_hand:
-                    if card[0] == c1:
-                        c1_check = True
-                    if card[0] == c2:
-                        c2_check = True
-                    if card[0] == c3:
-                        c3_check = True
-                    if card[0] == c4:
-                        c4_check = True
-                    if card[0] == c5:
-                        c5_check = True
-                if c1_check and c2_check and c3_check and c4_check and c5_check:
-                    print('straight', player)
-                    match.append(player)
-                    still_in.remove(player)
-            if match:
-                rankings.append(match)
-
-        # 3 of a kind check
-        for number in cards:
-            match = []
-            match_3 = []
-            for player in still_in:
-                score3 = 0
-                for card in player.hand:
-                    if card[0] == number:
-                        score3 += 1
-                if score3 == 3:
-                    print('3 of kind', player)
-                    match_3.append(player)
-                    still_in.remove(player)
-            if match_3:
-                for kicker1 in cards:
-                    if kicker1 != number:
-                        match_k1 = []
-                        match_k2 = []
-                        for player_1 in match_3:
-                            for card in player_1.hand:
-                                if card[0] == kicker1:
-                                    match_k1.append(player_1)
-                        if len(match_k1) > 1:
-                            for kicker2 in cards:
-                                if kicker2 != number and kicker2 != kicker1:
-                                    for player_2 in match_k1:
-                                        for card in player_2.hand:
-                                            if card[0] == kicker2:
-                                                match_k2.append(player_2)
-                        if match_k2:
-                            rankings.append(match_k2)
-                        elif match_k1:
-                            rankings.append(match_k1)
-
-            if match:
-                rankings.append(match)
-
-        # 2 pair check
-        # 2 of a kind check
-        # high card check
-
-        return rankings
+                groups.setdefault(hand_rank(player.hand), []).append(player)
+        return [groups[strength] for strength in sorted(groups, reverse=True)]
 
 
 class TexasHoldEm(PokerGame):
@@ -271,10 +305,11 @@ class TexasHoldEm(PokerGame):
             for rank in rankings:
                 max_bet = 0
                 for winner in rank:
-                    if self.contributions[winner] > max_bet:
+                    if self.contributions.get(winner, 0) > max_bet:
                         max_bet = self.contributions[winner]
                 for winner in rank:
-                    waged = self.contributions[winner]
+                    # a player who never bet has no claim on the pot
+                    waged = self.contributions.get(winner, 0)
                     winners = len(rank)
                     for player in self.contributions:
                         winnings = min(waged, self.contributions[player])
@@ -301,12 +336,12 @@ class TexasHoldEm(PokerGame):
 
     def deal_cards(self):
         self.round = 'pre flop'
-        self.comm_cards = []
-        self.burn_pile = []
+        self.comm_cards.clear()
+        self.burn_pile.clear()
         self.shuffle()
         for _ in range(self.cards_dealt):
             for player in self.players:
-                player.deal_card(self.deck.pop(0))
+                player.deal_card(self.draw())
         for player in self.players:
             player.in_hand = True
         sb = self.players[self.small_blind]
@@ -316,25 +351,25 @@ class TexasHoldEm(PokerGame):
 
     def flop(self):
         self.round = 'pre turn'
-        self.burn_pile.append(self.deck.pop(0))
+        self.burn_pile.append(self.draw())
         for _ in range(3):
-            card = self.deck.pop(0)
+            card = self.draw()
             self.comm_cards.append(card)
             for player in self.players:
                 player.deal_card(card)
 
     def turn(self):
         self.round = 'pre river'
-        self.burn_pile.append(self.deck.pop(0))
-        card = self.deck.pop(0)
+        self.burn_pile.append(self.draw())
+        card = self.draw()
         self.comm_cards.append(card)
         for player in self.players:
             player.deal_card(card)
 
     def river(self):
         self.round = 'post river'
-        self.burn_pile.append(self.deck.pop(0))
-        card = self.deck.pop(0)
+        self.burn_pile.append(self.draw())
+        card = self.draw()
         self.comm_cards.append(card)
         for player in self.players:
             player.deal_card(card)
@@ -348,6 +383,8 @@ class Player(object):
     emulates a player in a game of poker
     """
 
+    __slots__ = ('name', 'chips', 'hand', 'seat', 'in_hand')
+
     def __init__(self, name, chips):
         """
         input parameter:    name
@@ -384,8 +421,9 @@ class Player(object):
 
     def fold(self, show=False):
         if show:
-            print(self.hand)
-        self.hand = []
+            print(card_names(self.hand))
+        # emptied in place, the list keeps its room for the next hand
+        self.hand.clear()
         self.in_hand = False
 
     def deal_card(self, card):
@@ -413,9 +451,11 @@ if __name__ == '__main__':
     for guy in guys_game.players:
         print(guy.name, guy.chips)
 
-    print(guys_game.evaluate())
+    rankings = guys_game.evaluate()
+    for group in rankings:
+        print(group, rank_category(hand_rank(group[0].hand)))
 
-    guys_game.pot.divvy([[p3], [p2]])
+    guys_game.pot.divvy(rankings)
 
     for guy in guys_game.players:
-        print(guy.name, guy.chips, guy.in_hand, guy.hand)
+        print(guy.name, guy.chips, guy.in_hand, card_names(guy.hand))
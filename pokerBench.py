@@ -0,0 +1,270 @@
+# correctness checks and benchmarks for the poker hand evaluator
+
+import argparse
+import itertools
+import json
+import random
+import sys
+import time
+from collections import Counter
+
+from benchTools import write_report
+from poker import HAND_CATEGORIES, Player, TexasHoldEm, card_code, hand_rank, hand_ranks, np
+
+# number of 5 card hands in each category, out of all 2,598,960
+FIVE_CARD_COUNTS = {
+    'high card': 1302540,
+    'pair': 1098240,
+    'two pair': 123552,
+    'three of a kind': 54912,
+    'straight': 10200,
+    'flush': 5108,
+    'full house': 3744,
+    'four of a kind': 624,
+    'straight flush': 40,
+}
+
+
+def reference_rank(cards):
+    """
+    scores exactly 5 card codes the slow, obvious way, written apart from the lookup
+    tables so the two can be checked against each other. returns the same integer
+    layout as hand_rank: category << 20 followed by the deciding ranks, a nibble each.
+    """
+
+    ranks = sorted((card >> 2 for card in cards), reverse=True)
+    flush = len({card & 3 for card in cards}) == 1
+    distinct = sorted(set(ranks), reverse=True)
+    straight = None
+    if len(distinct) == 5:
+        if distinct[0] - distinct[4] == 4:
+            straight = distinct[0]
+        elif distinct == [12, 3, 2, 1, 0]:
+            straight = 3
+
+    # ranks ordered by how often they appear, then by rank
+    grouped = sorted(Counter(ranks).items(), key=lambda item: (item[1], item[0]), reverse=True)
+    shape = [count for _, count in grouped]
+    order = [rank for rank, _ in grouped]
+    if straight is not None and flush:
+        category, deciding = 8, [straight]
+    elif shape == [4, 1]:
+        category, deciding = 7, order
+    elif shape == [3, 2]:
+        category, deciding = 6, order
+    elif flush:
+        category, deciding = 5, ranks
+    elif straight is not None:
+        category, deciding = 4, [straight]
+    elif shape == [3, 1, 1]:
+        category, deciding = 3, order
+    elif shape == [2, 2, 1]:
+        category, deciding = 2, order
+    elif shape == [2, 1, 1, 1]:
+        category, deciding = 1, order
+    else:
+        category, deciding = 0, ranks
+
+    value = category
+    for position in range(5):
+        value = (value << 4) | (deciding[position] if position < len(deciding) else 0)
+    return value
+
+
+def verify_five():
+    """
+    every 5 card hand: hand_rank must equal reference_rank, the category counts must be
+    the textbook ones and there must be 7462 distinct strengths. returns a dictionary
+    of the findings; 'ok' is False on any mismatch.
+    """
+
+    counts = Counter()
+    strengths = set()
+    mismatches = 0
+    for cards in itertools.combinations(range(52), 5):
+        strength = hand_rank(cards)
+        if strength != reference_rank(cards):
+            mismatches += 1
+        counts[HAND_CATEGORIES[strength >> 20]] += 1
+        strengths.add(strength)
+    return {
+        'hands': sum(counts.values()),
+        'mismatches': mismatches,
+        'distinct_strengths': len(strengths),
+        'category_counts': dict(counts),
+        'ok': mismatches == 0 and len(strengths) == 7462 and dict(counts) == FIVE_CARD_COUNTS,
+    }
+
+
+def verify_seven(hands=200000, seed=0):
+    """
+    random 6 and 7 card hands: hand_rank must equal the best reference_rank over every 5
+    card subset, and hand_ranks (numpy) must agree with hand_rank.
+    """
+
+    rng = random.Random(seed)
+    mismatches = 0
+    batch_mismatches = 0
+    for size in (6, 7):
+        dealt = [rng.sample(range(52), size) for _ in range(hands // 2)]
+        single = [hand_rank(cards) for cards in dealt]
+        for cards, strength in zip(dealt, single):
+            if strength != max(reference_rank(five) for five in itertools.combinations(cards, 5)):
+                mismatches += 1
+        if np is not None:
+            batch_mismatches += int((hand_ranks(dealt) != np.array(single)).sum())
+    return {
+        'hands': 2 * (hands // 2),
+        'mismatches': mismatches,
+        'numpy_mismatches': batch_mismatches if np is not None else None,
+        'ok': mismatches == 0 and batch_mismatches == 0,
+    }
+
+
+def bench_eval(hands=1000000, seed=0):
+    """
+    7 card evaluations per second through hand_rank and through hand_ranks
+    """
+
+    rng = random.Random(seed)
+    deck = list(range(52))
+    dealt = [rng.sample(deck, 7) for _ in range(hands)]
+    hand_rank(dealt[0])
+
+    start = time.perf_counter()
+    for cards in dealt:
+        hand_rank(cards)
+    single = time.perf_counter() - start
+    results = {'hands': hands, 'hand_rank_per_sec': hands / single}
+
+    if np is not None:
+        array = np.array(dealt, dtype=np.int64)
+        hand_ranks(array[:1])
+        start = time.perf_counter()
+        hand_ranks(array)
+        results['hand_ranks_per_sec'] = hands / (time.perf_counter() - start)
+    return results
+
+
+class LegacyHoldEm(TexasHoldEm):
+    """
+    the game as it dealt before the integer deck: 'as' style string cards popped off the
+    front of the list, a new hand list per player per deal and string to code conversion
+    before evaluating. the old deck was never refilled and ran dry after three deals of
+    four players, so this one is rebuilt from a copy on every shuffle.
+    """
+
+    def __init__(self, players, blinds):
+        self._cards = [rank + suit for suit in 'schd' for rank in 'akqj098765432']
+        super().__init__(players, blinds)
+
+    def shuffle(self):
+        for player in self.players:
+            player.hand = []
+            player.in_hand = False
+        self.deck = list(self._cards)
+        random.shuffle(self.deck)
+
+    def deal_cards(self):
+        self.round = 'pre flop'
+        self.comm_cards = []
+        self.burn_pile = []
+        self.shuffle()
+        for _ in range(self.cards_dealt):
+            for player in self.players:
+                player.deal_card(self.deck.pop(0))
+        for player in self.players:
+            player.in_hand = True
+        self.make_bet(self.players[self.small_blind], self.blinds[0])
+        self.make_bet(self.players[self.big_blind], self.blinds[1])
+
+    def __street(self, cards):
+        self.burn_pile.append(self.deck.pop(0))
+        for _ in range(cards):
+            card = self.deck.pop(0)
+            self.comm_cards.append(card)
+            for player in self.players:
+                player.deal_card(card)
+
+    def flop(self):
+        self.round = 'pre turn'
+        self.__street(3)
+
+    def turn(self):
+        self.round = 'pre river'
+        self.__street(1)
+
+    def river(self):
+        self.round = 'post river'
+        self.__street(1)
+
+    def evaluate(self):
+        groups = {}
+        for player in self.players:
+            if player.in_hand:
+                strength = hand_rank([card_code(card) for card in player.hand])
+                groups.setdefault(strength, []).append(player)
+        return [groups[strength] for strength in sorted(groups, reverse=True)]
+
+
+def play_hands(game, hands, evaluate=True):
+    """
+    deals hands full hold 'em hands (hole cards, flop, turn, river) and scores them when
+    evaluate is set. returns the seconds taken.
+    """
+
+    start = time.perf_counter()
+    for _ in range(hands):
+        game.deal_cards()
+        game.flop()
+        game.turn()
+        game.river()
+        if evaluate:
+            game.evaluate()
+    return time.perf_counter() - start
+
+
+def bench_deal(hands=200000, players=6, seed=0):
+    """
+    full hands per second for the integer deck against the legacy string deck, dealing
+    only and dealing plus evaluate
+    """
+
+    results = {'hands': hands, 'players': players}
+    for name, game_class in (('legacy', LegacyHoldEm), ('current', TexasHoldEm)):
+        random.seed(seed)
+        seats = [Player('p%d' % seat, 1 << 60) for seat in range(players)]
+        game = game_class(seats, [50, 100])
+        play_hands(game, 1000)
+        results[name + '_deals_per_sec'] = hands / play_hands(game, hands, evaluate=False)
+        results[name + '_hands_per_sec'] = hands / play_hands(game, hands)
+    results['deal_speedup'] = results['current_deals_per_sec'] / results['legacy_deals_per_sec']
+    results['hand_speedup'] = results['current_hands_per_sec'] / results['legacy_hands_per_sec']
+    return results
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description='poker evaluator checks and benchmarks')
+    parser.add_argument('bench', nargs='?', default='eval', choices=['eval', 'verify', 'deal'])
+    parser.add_argument('--hands', type=int, default=1000000)
+    parser.add_argument('--players', type=int, default=6)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help='write the results to this json file')
+    args = parser.parse_args()
+
+    if args.bench == 'verify':
+        results = {'five': verify_five(), 'seven': verify_seven(min(args.hands, 200000),
+                                                                 args.seed)}
+        print(json.dumps(results, indent=2))
+        if not (results['five']['ok'] and results['seven']['ok']):
+            sys.exit(1)
+    elif args.bench == 'deal':
+        results = bench_deal(min(args.hands, 200000), args.players, args.seed)
+        print(json.dumps(results, indent=2))
+    else:
+        results = bench_eval(args.hands, args.seed)
+        print(json.dumps(results, indent=2))
+
+    if args.output:
+        write_report(args.output, args.bench, args, results)